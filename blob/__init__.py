@@ -0,0 +1 @@
+"""Coloured shape detection on NAO camera frames and photos"""
@@ -0,0 +1,181 @@
+"""
+Run the shape detector over whole directories on a process pool
+
+    python batch.py                                  # grid/, no_grid/ and out_of_frame/
+    python batch.py grid 1.jpg --min-area 5000 --out sweep/5000 --jsonl sweep/5000.jsonl
+    python batch.py frames/ --workers 8 --no-images
+
+One JSON line per image is streamed to stdout (or --jsonl) as soon as it is
+done, with the detections and the read/detect/write times in milliseconds.
+Annotated and cropped images go to --out, mirroring the input directories.
+A timing summary is printed to stderr at the end.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+import cv2
+import numpy as np
+
+from detector import ShapeDetector, MIN_AREA, EPSILON, largest_bbox
+
+DEFAULT_INPUTS = ["grid", "no_grid", "out_of_frame"]
+EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Outputs of main.py that live next to the photos
+SKIP_NAMES = ("detected_shapes.png", "cropped_object.png")
+
+# Set in each worker process by _init_worker
+detector = None
+settings = None
+
+
+def find_images(inputs):
+    """Image files under the given files and directories, sorted"""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(EXTENSIONS) and name not in SKIP_NAMES:
+                        paths.append(os.path.join(root, name))
+        elif os.path.isfile(path):
+            paths.append(path)
+        else:
+            print(f"Skipping {path}: no such file or directory", file=sys.stderr)
+    return paths
+
+
+def _init_worker(worker_settings):
+    global detector, settings
+    settings = worker_settings
+    # One OpenCV thread per process, the pool already keeps every core busy
+    cv2.setNumThreads(1)
+    detector = ShapeDetector(min_area=settings["min_area"], epsilon=settings["epsilon"])
+
+
+def _output_paths(path):
+    stem = os.path.splitext(os.path.relpath(path))[0].replace("..", "_")
+    base = os.path.join(settings["out"], stem)
+    return f"{base}_detected.{settings['format']}", f"{base}_cropped.{settings['format']}"
+
+
+def process_image(path):
+    """Detect shapes in one image; returns its JSON-serialisable record"""
+    record = {"path": path}
+    start = time.time()
+    image = cv2.imread(path)
+    read = time.time()
+    if image is None:
+        record["error"] = "Could not read the image"
+        return record
+
+    # Outlines go on a copy, so the crop below stays clean
+    annotated = image.copy() if settings["write_images"] else image
+    detected_objects = detector.detect(annotated, draw=settings["write_images"])
+    detected = time.time()
+
+    if settings["write_images"]:
+        annotated_path, cropped_path = _output_paths(path)
+        directory = os.path.dirname(annotated_path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass  # Made by another worker in the meantime
+        cv2.imwrite(annotated_path, annotated)
+        bbox = largest_bbox(detected_objects)
+        if bbox is not None:
+            x_min, y_min, x_max, y_max = bbox
+            cv2.imwrite(cropped_path, image[y_min:y_max, x_min:x_max])
+    written = time.time()
+
+    record["size"] = [image.shape[1], image.shape[0]]
+    record["objects"] = [
+        {
+            "number": obj["number"],
+            "shape": obj["shape"],
+            "color": obj["color"],
+            "position": list(obj["position"]),
+            "bbox": list(obj["bbox"]),
+            "area": obj["area"],
+            "perimeter": round(obj["perimeter"], 1),
+            "vertices": len(obj["x_values"]),
+        }
+        for obj in detected_objects
+    ]
+    record["timing_ms"] = {
+        "read": round((read - start) * 1000.0, 2),
+        "detect": round((detected - read) * 1000.0, 2),
+        "write": round((written - detected) * 1000.0, 2),
+        "total": round((written - start) * 1000.0, 2),
+    }
+    return record
+
+
+def _summary(records, wall):
+    totals = np.array([r["timing_ms"]["total"] for r in records if "timing_ms" in r])
+    detects = np.array([r["timing_ms"]["detect"] for r in records if "timing_ms" in r])
+    failed = sum(1 for r in records if "error" in r)
+    lines = [f"{len(records)} images ({failed} failed) in {wall:.2f} s, {len(records) / wall:.1f} images/s"]
+    if len(totals):
+        lines.append(
+            f"per image: total p50 {np.percentile(totals, 50):.1f} ms, p90 {np.percentile(totals, 90):.1f} ms"
+            f" | detect p50 {np.percentile(detects, 50):.1f} ms, max {detects.max():.1f} ms"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect coloured shapes in many images at once")
+    parser.add_argument("inputs", nargs="*", default=DEFAULT_INPUTS, help="image files or directories")
+    parser.add_argument("--min-area", type=float, default=MIN_AREA)
+    parser.add_argument("--epsilon", type=float, default=EPSILON)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--out", default="output", help="directory for annotated and cropped images")
+    # Writing a 12 MP PNG takes several times longer than detecting the shapes in it
+    parser.add_argument("--format", choices=["jpg", "png"], default="jpg", help="format of the output images")
+    parser.add_argument("--no-images", action="store_true", help="only report detections, write no images")
+    parser.add_argument("--jsonl", help="write the JSON lines here instead of stdout")
+    args = parser.parse_args()
+
+    paths = find_images(args.inputs)
+    if not paths:
+        print("Error: No images found.", file=sys.stderr)
+        return 1
+
+    worker_settings = {
+        "min_area": args.min_area,
+        "epsilon": args.epsilon,
+        "out": args.out,
+        "format": args.format,
+        "write_images": not args.no_images,
+    }
+    if args.jsonl and os.path.dirname(args.jsonl) and not os.path.isdir(os.path.dirname(args.jsonl)):
+        os.makedirs(os.path.dirname(args.jsonl))
+    output = open(args.jsonl, "w") if args.jsonl else sys.stdout
+    records = []
+    start = time.time()
+    pool = multiprocessing.Pool(args.workers, _init_worker, (worker_settings,))
+    try:
+        # Small chunks keep results streaming and the workers evenly loaded
+        chunksize = max(1, min(16, len(paths) // (args.workers * 4)))
+        for record in pool.imap_unordered(process_image, paths, chunksize):
+            records.append(record)
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+    finally:
+        pool.close()
+        pool.join()
+        if output is not sys.stdout:
+            output.close()
+
+    print(_summary(records, time.time() - start), file=sys.stderr)
+    return 0 if all("error" not in r for r in records) else 1
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,291 @@
+"""
+Accuracy and speed of the shape detector over a grid of settings
+
+    python benchmark.py                       # full grid on all annotated images
+    python benchmark.py --scale 1 --top 20 --json sweep.json
+    python benchmark.py --baseline-only       # just score the current defaults
+
+Every combination of HSV bounds (hue bands per colour, including a second
+red band at the top of the hue circle, and the saturation/value floors),
+min_area and approxPolyDP epsilon is scored against annotations.json.
+A detection counts if its colour matches a labelled object and their
+boxes overlap by at least --iou; shape accuracy is measured over those
+matches. ms/frame is the detection time at --scale.
+
+Each HSV setting is one task on the process pool: its masks and contours
+are computed once per image and shared by all min_area/epsilon values.
+"""
+
+import sys
+import json
+import time
+import argparse
+import itertools
+import collections
+import multiprocessing
+import cv2
+import numpy as np
+
+from detector import ShapeDetector, COLOR_RANGES, MIN_AREA, EPSILON
+
+ANNOTATIONS = "annotations.json"
+
+# Search space; areas are in full resolution pixels
+YELLOW_HUES = [(20, 30), (18, 35)]
+BLUE_HUES = [(100, 130), (90, 130)]
+RED_HUES = [
+    [(0, 10)],
+    [(0, 10), (170, 179)],
+    [(0, 6), (170, 179)],
+    [(0, 4), (172, 179)],
+]
+SATURATION_MIN = [80, 100, 130]
+VALUE_MIN = [60, 100]
+MIN_AREAS = [2500, 5000, 10000, 20000]
+EPSILONS = [0.02, 0.03, 0.04, 0.05]
+
+# Set in each worker process by _init_worker
+images = None
+settings = None
+
+
+def color_ranges(yellow, blue, red, s_min, v_min):
+    """Detector colour ranges for one point of the HSV grid"""
+    band = lambda hues: ([hues[0], s_min, v_min], [hues[1], 255, 255])
+    return collections.OrderedDict([
+        ("Yellow", [band(yellow)]),
+        ("Blue", [band(blue)]),
+        ("Red", [band(hues) for hues in red]),
+    ])
+
+
+def hsv_grid():
+    """(params, colour ranges) for every HSV combination searched"""
+    grid = []
+    for yellow, blue, red, s_min, v_min in itertools.product(YELLOW_HUES, BLUE_HUES, RED_HUES, SATURATION_MIN, VALUE_MIN):
+        params = collections.OrderedDict([
+            ("yellow", "%d-%d" % yellow),
+            ("blue", "%d-%d" % blue),
+            ("red", "+".join("%d-%d" % hues for hues in red)),
+            ("s_min", s_min),
+            ("v_min", v_min),
+        ])
+        grid.append((params, color_ranges(yellow, blue, red, s_min, v_min)))
+    return grid
+
+
+def baseline_task():
+    """The detector's current defaults, in the same form as hsv_grid entries"""
+    bands = lambda color: "+".join("%d-%d" % (lower[0], upper[0]) for lower, upper in COLOR_RANGES[color])
+    lower = COLOR_RANGES["Yellow"][0][0]
+    params = collections.OrderedDict([
+        ("yellow", bands("Yellow")), ("blue", bands("Blue")), ("red", bands("Red")),
+        ("s_min", lower[1]), ("v_min", lower[2]),
+    ])
+    return params, COLOR_RANGES, [MIN_AREA], [EPSILON]
+
+
+def load_annotations(path):
+    with open(path) as f:
+        return json.load(f)["images"]
+
+
+def _init_worker(annotations, worker_settings):
+    global images, settings
+    settings = worker_settings
+    cv2.setNumThreads(1)
+    # Only the HSV image is kept, every task reuses it and adds the conversion time
+    images = []
+    scale = settings["scale"]
+    for path, objects in sorted(annotations.items()):
+        image = cv2.imread(path)
+        if image is None:
+            print(f"Skipping {path}: could not read the image", file=sys.stderr)
+            continue
+        if scale != 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        start = time.time()
+        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        images.append((path, hsv, objects, (time.time() - start) * 1000.0))
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = float(w * h)
+    return inter / (aw * ah + bw * bh - inter)
+
+
+def match(detections, truth, min_iou):
+    """Pair detections with labelled objects of the same colour, best overlap first
+
+    Returns (matched (detection, object) pairs, unmatched detections, missed objects).
+    """
+    pairs = []
+    for i, obj in enumerate(detections):
+        for j, labelled in enumerate(truth):
+            if obj["color"] == labelled["color"]:
+                overlap = iou(obj["bbox"], labelled["bbox"])
+                if overlap >= min_iou:
+                    pairs.append((overlap, i, j))
+    pairs.sort(reverse=True)
+    used_det, used_truth, matched = set(), set(), []
+    for overlap, i, j in pairs:
+        if i not in used_det and j not in used_truth:
+            used_det.add(i)
+            used_truth.add(j)
+            matched.append((detections[i], truth[j]))
+    extra = [obj for i, obj in enumerate(detections) if i not in used_det]
+    missed = [obj for j, obj in enumerate(truth) if j not in used_truth]
+    return matched, extra, missed
+
+
+def _score(params, min_area, epsilon, per_image, mask_ms, min_iou):
+    """Totals for one setting; per_image is [(path, detections, truth, describe_ms)]"""
+    tp = fp = fn = shapes = shapes_right = 0
+    ms = []
+    errors = []
+    for (path, detections, truth, describe_ms), mask_time in zip(per_image, mask_ms):
+        matched, extra, missed = match(detections, truth, min_iou)
+        tp += len(matched)
+        fp += len(extra)
+        fn += len(missed)
+        for obj, labelled in matched:
+            if labelled["shape"] is not None:
+                shapes += 1
+                if obj["shape"] == labelled["shape"]:
+                    shapes_right += 1
+                else:
+                    errors.append(f"{path}: {labelled['color']} {labelled['shape']} seen as {obj['shape']}")
+        errors.extend(f"{path}: missed {obj['color']} {obj['shape'] or 'object'}" for obj in missed)
+        errors.extend(f"{path}: extra {obj['color']} {obj['shape']} at {obj['position']}" for obj in extra)
+        ms.append(mask_time + describe_ms)
+
+    precision = tp / float(tp + fp) if tp + fp else 0.0
+    recall = tp / float(tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    result = collections.OrderedDict(params)
+    result.update([
+        ("min_area", min_area),
+        ("epsilon", epsilon),
+        ("precision", round(precision, 3)),
+        ("recall", round(recall, 3)),
+        ("f1", round(f1, 3)),
+        ("shape_accuracy", round(shapes_right / float(shapes), 3) if shapes else None),
+        ("ms_per_frame", round(float(np.mean(ms)), 2)),
+        ("errors", errors),
+    ])
+    return result
+
+
+def evaluate(task):
+    """Score every min_area/epsilon pair for one HSV setting"""
+    params, ranges, min_areas, epsilons = task
+    area_scale = settings["scale"] ** 2
+    detector = ShapeDetector(ranges)
+
+    # Masks and contours once per image, at the smallest area searched
+    contours, mask_ms = [], []
+    for path, hsv, truth, hsv_ms in images:
+        start = time.time()
+        contours.append(detector.contours(hsv, min(min_areas) * area_scale))
+        mask_ms.append(hsv_ms + (time.time() - start) * 1000.0)
+
+    results = []
+    for epsilon in epsilons:
+        detector.epsilon = epsilon
+        described = []
+        for (path, hsv, truth, hsv_ms), found in zip(images, contours):
+            start = time.time()
+            objects = [detector.describe(color, contour, area, i + 1) for i, (color, contour, area) in enumerate(found)]
+            per_object_ms = (time.time() - start) * 1000.0 / max(1, len(found))
+            described.append((path, objects, truth, per_object_ms))
+
+        for min_area in min_areas:
+            per_image = []
+            for path, objects, truth, per_object_ms in described:
+                kept = [obj for obj in objects if obj["area"] > min_area * area_scale]
+                # Back to full resolution pixels, like the annotations
+                scaled = [dict(obj, bbox=[v / settings["scale"] for v in obj["bbox"]],
+                               position=tuple(int(v / settings["scale"]) for v in obj["position"])) for obj in kept]
+                per_image.append((path, scaled, truth, per_object_ms * len(kept)))
+            results.append(_score(params, min_area, epsilon, per_image, mask_ms, settings["iou"]))
+    return results
+
+
+def pareto_front(results):
+    """Results no other result beats on both F1 and ms/frame"""
+    front, best_f1 = [], -1.0
+    for result in sorted(results, key=lambda r: (r["ms_per_frame"], -r["f1"])):
+        if result["f1"] > best_f1:
+            front.append(result)
+            best_f1 = result["f1"]
+    return front
+
+
+def _row(result):
+    shape_accuracy = result["shape_accuracy"]
+    return (
+        f"yellow {result['yellow']:>5} | blue {result['blue']:>6} | red {result['red']:>13}"
+        f" | s>={result['s_min']:3d} v>={result['v_min']:3d} | area {result['min_area']:5d} | eps {result['epsilon']:.2f}"
+        f" | P {result['precision']:.3f} R {result['recall']:.3f} F1 {result['f1']:.3f}"
+        f" | shape {shape_accuracy if shape_accuracy is not None else 0:.3f} | {result['ms_per_frame']:6.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid search detector settings against annotated images")
+    parser.add_argument("--annotations", default=ANNOTATIONS)
+    parser.add_argument("--scale", type=float, default=0.5, help="resize images by this factor before detecting")
+    parser.add_argument("--iou", type=float, default=0.5, help="box overlap needed to count a detection")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--top", type=int, default=10, help="number of best settings to print")
+    parser.add_argument("--baseline-only", action="store_true", help="only score the detector defaults")
+    parser.add_argument("--json", help="write every result to this file")
+    args = parser.parse_args()
+
+    annotations = load_annotations(args.annotations)
+    worker_settings = {"scale": args.scale, "iou": args.iou}
+    tasks = [baseline_task()]
+    if not args.baseline_only:
+        tasks += [(params, ranges, MIN_AREAS, EPSILONS) for params, ranges in hsv_grid()]
+
+    start = time.time()
+    pool = multiprocessing.Pool(args.workers, _init_worker, (annotations, worker_settings))
+    try:
+        task_results = pool.map(evaluate, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    baseline = task_results[0][0]
+    results = [result for results in task_results[1:] for result in results] or [baseline]
+    print(f"{len(results)} settings on {len(annotations)} images in {time.time() - start:.1f} s"
+          f" (scale {args.scale}, {args.workers} workers)")
+
+    ranked = sorted(results, key=lambda r: (-r["f1"], -(r["shape_accuracy"] or 0), r["ms_per_frame"]))
+    print("\nBaseline (detector defaults):")
+    print(_row(baseline))
+    print(f"\nBest {min(args.top, len(ranked))} by F1, then shape accuracy, then speed:")
+    for result in ranked[:args.top]:
+        print(_row(result))
+    print("\nFastest setting for each F1 level:")
+    for result in pareto_front(results):
+        print(_row(result))
+
+    for title, result in (("baseline", baseline), ("best", ranked[0])):
+        print(f"\nErrors with the {title} settings:")
+        for error in result["errors"] or ["none"]:
+            print(f"  {error}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"baseline": baseline, "results": ranked}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
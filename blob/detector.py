@@ -0,0 +1,250 @@
+# -*- coding: future_fstrings -*-
+"""
+Coloured shape detection
+Finds yellow, blue and red triangles, rectangles and circles in BGR or RGB images
+"""
+
+import collections
+import cv2
+import numpy as np
+
+# Colour -> list of ([h, s, v] lower, [h, s, v] upper) bands, OpenCV HSV (hue 0-179)
+COLOR_RANGES = collections.OrderedDict([
+    ('Yellow', [([20, 100, 100], [30, 255, 255])]),
+    ('Blue', [([100, 100, 100], [130, 255, 255])]),
+    # Red wraps around the hue circle; up to 10 also takes in the orange boards and the shapes on them
+    ('Red', [([0, 100, 100], [4, 255, 255]), ([172, 100, 100], [179, 255, 255])]),
+])
+
+# Picked with benchmark.py against annotations.json: F1 0.90 against 0.72 with red 0-10 and min area 10k,
+# the narrower red band no longer merges the shapes with the orange board, so smaller ones can be kept
+MIN_AREA = 2500
+EPSILON = 0.04  # approxPolyDP tolerance as a fraction of the perimeter
+
+
+class ShapeDetector:
+    """Reusable detector: one HSV conversion and one hue lookup per image
+
+    Every (colour, band) gets a bit in a 256-entry hue table, so a single
+    cv2.LUT labels each pixel with all the bands its hue falls in. Bands
+    sharing saturation/value bounds (all of the defaults do) are checked
+    with one inRange between them, so extra hue bands such as a second red
+    range come almost for free.
+    """
+
+    def __init__(self, color_ranges=None, min_area=MIN_AREA, epsilon=EPSILON, rgb=False):
+        self.color_ranges = color_ranges or COLOR_RANGES
+        self.min_area = min_area
+        self.epsilon = epsilon
+        self.hsv_code = cv2.COLOR_RGB2HSV if rgb else cv2.COLOR_BGR2HSV
+        self.color_bits, self.hue_lut, self.sv_groups = self._build_tables(self.color_ranges)
+
+    @staticmethod
+    def _build_tables(color_ranges):
+        bands = [(color, band) for color, color_bands in color_ranges.items() for band in color_bands]
+        if len(bands) > 8:
+            raise ValueError("At most 8 colour bands are supported")
+
+        hue_lut = np.zeros(256, np.uint8)
+        color_bits = collections.OrderedDict((color, 0) for color in color_ranges)
+        # (lower, upper) saturation/value bounds -> bits of the bands using them
+        sv_groups = collections.OrderedDict()
+        hues = np.arange(256)
+        for bit, (color, (lower, upper)) in enumerate(bands):
+            hue_lut[(hues >= lower[0]) & (hues <= upper[0])] |= 1 << bit
+            color_bits[color] |= 1 << bit
+            key = ((0, lower[1], lower[2]), (255, upper[1], upper[2]))
+            sv_groups[key] = sv_groups.get(key, 0) | 1 << bit
+        return color_bits, hue_lut, sv_groups
+
+    def to_hsv(self, image):
+        return cv2.cvtColor(image, self.hsv_code)
+
+    def label(self, hsv):
+        """Bits of every colour band each pixel falls in, as one HxW uint8 array"""
+        hue = cv2.LUT(cv2.extractChannel(hsv, 0), self.hue_lut)
+        labels = None
+        for (lower, upper), bits in self.sv_groups.items():
+            inside = cv2.inRange(hsv, np.array(lower, np.uint8), np.array(upper, np.uint8))
+            part = cv2.bitwise_and(hue, inside)
+            if len(self.sv_groups) > 1:
+                part = cv2.bitwise_and(part, bits)
+            labels = part if labels is None else cv2.bitwise_or(labels, part)
+        return labels
+
+    def masks(self, hsv):
+        """Colour -> uint8 0/255 mask, all cut from a single labelling pass"""
+        labels = self.label(hsv)
+        masks = collections.OrderedDict()
+        for color, bits in self.color_bits.items():
+            masks[color] = cv2.compare(cv2.bitwise_and(labels, bits), 0, cv2.CMP_GT)
+        return masks
+
+    def contours(self, hsv, min_area=None):
+        """(colour, contour, area) of every blob larger than min_area (default self.min_area)"""
+        min_area = self.min_area if min_area is None else min_area
+        found = []
+        for color, mask in self.masks(hsv).items():
+            # OpenCV 3 returns (image, contours, hierarchy), 2 and 4 return (contours, hierarchy)
+            contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+            for contour in contours:
+                area = cv2.contourArea(contour)
+                if area > min_area:
+                    found.append((color, contour, area))
+        return found
+
+    def describe(self, color, contour, area, number, offset=(0, 0)):
+        """Classify one contour and return its result dict"""
+        dx, dy = offset
+        perimeter = cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, self.epsilon * perimeter, True)
+
+        if len(approx) == 3:
+            shape = "Triangle"
+        elif len(approx) == 4:
+            shape = "Rectangle"
+        else:
+            shape = "Circle"
+
+        M = cv2.moments(contour)
+        if M["m00"] != 0:
+            cX = int(M["m10"] / M["m00"])
+            cY = int(M["m01"] / M["m00"])
+        else:
+            cX, cY = 0, 0
+
+        x, y, w, h = cv2.boundingRect(contour)
+        x_values = [int(point[0][0]) + dx for point in approx]
+        y_values = [int(point[0][1]) + dy for point in approx]
+
+        return {
+            "number": number,
+            "shape": shape,
+            "color": color,
+            "position": (cX + dx, cY + dy),
+            "bbox": (x + dx, y + dy, w, h),
+            "perimeter": perimeter,
+            "area": area,
+            "approx_vertices": [[[px, py]] for px, py in zip(x_values, y_values)],
+            "x_values": x_values,
+            "y_values": y_values,
+            "description": f"{color} {shape} at {cX + dx - 20, cY + dy - 20} with a shape of {area}"
+        }
+
+    def detect(self, image, hsv=None, draw=False, offset=(0, 0)):
+        """Detect shapes; returns a list of result dicts, drawing on image only if draw is set
+
+        hsv may be passed in if the caller already converted the image.
+        offset is added to every coordinate, for images cropped out of a
+        larger frame.
+        """
+        if hsv is None:
+            hsv = self.to_hsv(image)
+
+        detected_objects = []
+        for color, contour, area in self.contours(hsv):
+            obj = self.describe(color, contour, area, len(detected_objects) + 1, offset)
+            detected_objects.append(obj)
+
+            if draw:
+                draw_detection(image, contour, obj, offset)
+
+        return detected_objects
+
+
+def draw_detection(image, contour, obj, offset=(0, 0)):
+    """Draw one detection's contour and number onto image, which offset is relative to"""
+    cX, cY = obj["position"][0] - offset[0], obj["position"][1] - offset[1]
+    cv2.drawContours(image, [contour], 0, (0, 255, 0), 2)
+    cv2.putText(image, str(obj["number"]), (cX - 20, cY - 20),
+                cv2.FONT_HERSHEY_SIMPLEX, 2.25, (0, 0, 0), 3)
+    return image
+
+
+def largest_bbox(detections):
+    """(x_min, y_min, x_max, y_max) of the largest detection's vertices, or None"""
+    if not detections:
+        return None
+    max_obj = max(detections, key=lambda x: x['area'])
+    return (min(max_obj['x_values']), min(max_obj['y_values']),
+            max(max_obj['x_values']), max(max_obj['y_values']))
+
+
+class ShapeTracker:
+    """Follows one shape, searching only a padded window around where it was last seen
+
+    The first frame, a lost target and every reacquire_every-th frame get a
+    full-frame detection, which picks the largest shape (of the wanted
+    colour/shape if given). Frames in between only run the detector on the
+    target's last bbox grown by padding times its size on each side. A
+    target touching the window edge may be cut off, so that frame falls
+    back to a full search too.
+    """
+
+    def __init__(self, detector=None, padding=0.5, reacquire_every=30, color=None, shape=None):
+        self.detector = detector or ShapeDetector()
+        self.padding = padding
+        self.reacquire_every = reacquire_every
+        self.color = color
+        self.shape = shape
+        self.counters = {"full": 0, "roi": 0, "lost": 0}
+        self.reset()
+
+    def reset(self):
+        """Forget the target; the next frame is searched in full"""
+        self.target = None
+        self.frames_since_full = 0
+
+    def update(self, image, hsv=None):
+        """Track the target into a new frame; returns its detection dict, or None if there is none"""
+        if self.target is not None and self.frames_since_full < self.reacquire_every:
+            found = self._search_window(image)
+            if found is not None:
+                self.frames_since_full += 1
+                self.counters["roi"] += 1
+                self.target = found
+                return found
+            self.counters["lost"] += 1
+
+        self.counters["full"] += 1
+        self.frames_since_full = 0
+        self.target = self._pick(self.detector.detect(image, hsv))
+        return self.target
+
+    def window(self, image_shape):
+        """(x0, y0, x1, y1) of the region searched around the target"""
+        x, y, w, h = self.target["bbox"]
+        pad_x, pad_y = int(w * self.padding) + 1, int(h * self.padding) + 1
+        height, width = image_shape[:2]
+        return max(0, x - pad_x), max(0, y - pad_y), min(width, x + w + pad_x), min(height, y + h + pad_y)
+
+    def _search_window(self, image):
+        x0, y0, x1, y1 = self.window(image.shape)
+        candidates = [
+            obj for obj in self.detector.detect(image[y0:y1, x0:x1], offset=(x0, y0))
+            if obj["color"] == self.target["color"]
+        ]
+        if not candidates:
+            return None
+        last_x, last_y = self.target["position"]
+        found = min(candidates, key=lambda obj: (obj["position"][0] - last_x) ** 2 + (obj["position"][1] - last_y) ** 2)
+
+        # Clipped by the window rather than by the frame: look at the whole frame instead
+        x, y, w, h = found["bbox"]
+        height, width = image.shape[:2]
+        if (x <= x0 and x0 > 0) or (y <= y0 and y0 > 0) or (x + w >= x1 and x1 < width) or (y + h >= y1 and y1 < height):
+            return None
+        return found
+
+    def _pick(self, detections):
+        candidates = [
+            obj for obj in detections
+            if (self.color is None or obj["color"] == self.color) and (self.shape is None or obj["shape"] == self.shape)
+        ]
+        if not candidates:
+            return None
+        if self.target is not None:
+            # Re-acquiring: stay on the same colour if it is still in view
+            same = [obj for obj in candidates if obj["color"] == self.target["color"]]
+            candidates = same or candidates
+        return max(candidates, key=lambda obj: obj["area"])
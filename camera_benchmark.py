@@ -0,0 +1,171 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Camera Benchmark
+Drives CameraController end to end against FakeVideoDevice, so capture, resize
+and display regressions can be measured without a robot
+
+    python camera_benchmark.py --seconds 10 --engines box,reduce,opencv
+    python camera_benchmark.py --source synthetic --latency 0.02 --bandwidth 4000000
+"""
+
+import os
+import time
+import json
+import argparse
+import config
+from fake_naoqi import FakeSession, FakeRobot, FakeVideoDevice, BLOB_DIR
+from robot_environment import NaoEnvironment
+from robot_agent import NaoActions
+
+
+
+def _cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def _rss_mb():
+    """Current resident memory; None where /proc is not available"""
+    # ru_maxrss would be the peak of the whole process, which later scenarios inherit
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 1048576.0, 1)
+
+
+def _end_warmup(agent, startup):
+    """Note when the first frame was painted, then start measuring afresh"""
+    first_frame = agent.get_camera_metrics()["time_to_first_frame_s"]
+    if first_frame is not None:
+        startup["first_frame_s"] = round(startup["connect_s"] + first_frame, 3)
+    agent.camera_controller.metrics.reset()
+
+
+def _run_headless(agent, warmup, seconds, startup):
+    agent.start_camera(lambda frame, fps: None)
+    time.sleep(warmup)
+    _end_warmup(agent, startup)
+    time.sleep(seconds)
+
+
+def _run_tk(agent, warmup, seconds, startup):
+    try:
+        import Tkinter as tk
+    except ImportError:
+        import tkinter as tk
+    root = tk.Tk()
+    root.withdraw()
+    agent.start_camera(lambda image, fps: None, root)
+    root.after(int(warmup * 1000), lambda: _end_warmup(agent, startup))
+    root.after(int((warmup + seconds) * 1000), root.quit)
+    root.mainloop()
+    agent.stop_camera()
+    root.destroy()
+
+
+def run_scenario(video, engine, seconds, warmup=2.0, use_tk=False, rpc_latency=0.0):
+    """Stream from the fake device for warmup + seconds and return the measurements"""
+    config.CAMERA_RESIZE_ENGINE = engine
+
+    rss_start = _rss_mb()
+    connect_start = time.time()
+    robot = FakeRobot(video=video)
+    nao = NaoEnvironment("benchmark", 0, lambda: FakeSession(latency=rpc_latency, jitter=0.0, robot=robot))
+    nao.init_robot()
+    agent = NaoActions(nao)
+    # The fake device stamps frames with the local clock
+    agent.camera_controller.metrics.set_clock_offset(0.0)
+    # Startup times are measured from before the connection
+    startup = {"connect_s": round(time.time() - connect_start, 3), "first_frame_s": None}
+
+    cpu_start = _cpu_time()
+    wall_start = time.time()
+    if use_tk:
+        _run_tk(agent, warmup, seconds, startup)
+    else:
+        _run_headless(agent, warmup, seconds, startup)
+    metrics = agent.get_camera_metrics()
+    cpu = _cpu_time() - cpu_start
+    wall = time.time() - wall_start
+    rss = _rss_mb()
+
+    agent.stop_camera()
+    agent.encoder.shutdown()
+    nao.close()
+
+    counters = metrics["counters"]
+    return {
+        "engine": engine,
+        "seconds": seconds,
+        "painted_fps": round(counters["painted"] / seconds, 1),
+        "fetched_fps": round(counters["fetched"] / seconds, 1),
+        "cpu_percent": round(100.0 * cpu / wall, 1),
+        "rss_mb": rss,
+        "rss_growth_mb": round(rss - rss_start, 1) if rss is not None else None,
+        "startup": startup,
+        "metrics": metrics,
+    }
+
+
+def _print_result(result):
+    metrics = result["metrics"]
+    stages = metrics["stages"]
+    g2g = metrics["glass_to_glass"]
+    counters = metrics["counters"]
+    print(
+        f"{result['engine']:>8} | painted {result['painted_fps']:5.1f} fps"
+        f" | fetched {result['fetched_fps']:5.1f} fps"
+        f" | dup {counters['duplicates']:4d} drop {counters['dropped_raw'] + counters['dropped_display']:4d}"
+        f" | fetch p50 {stages['fetch'].get('p50_ms', 0):6.2f} ms"
+        f" | resize p50/p99 {stages['resize'].get('p50_ms', 0):5.2f}/{stages['resize'].get('p99_ms', 0):5.2f} ms"
+        f" | g2g p50/p99 {g2g.get('p50_ms', 0):6.1f}/{g2g.get('p99_ms', 0):6.1f} ms"
+        f" | cpu {result['cpu_percent']:5.1f}% | rss {result['rss_mb']} MB (+{result['rss_growth_mb']})"
+        f" | connect {result['startup']['connect_s']} s, first frame {result['startup']['first_frame_s']} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the camera pipeline against a fake ALVideoDevice")
+    parser.add_argument("--source", default=BLOB_DIR, help="directory of JPEGs to replay, or 'synthetic'")
+    parser.add_argument("--resolution", type=int, default=config.CAMERA_RESOLUTION)
+    parser.add_argument("--color-space", type=int, default=config.CAMERA_COLOR_SPACE)
+    parser.add_argument("--fps", type=int, default=config.CAMERA_FPS)
+    parser.add_argument("--latency", type=float, default=0.0, help="injected seconds per fetch")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per fetch")
+    parser.add_argument("--rpc-latency", type=float, default=0.0, help="injected seconds per other NAOqi call")
+    parser.add_argument("--bandwidth", type=float, default=None, help="simulated link bytes per second")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--engines", default=config.CAMERA_RESIZE_ENGINE, help="comma separated resize engines")
+    parser.add_argument("--adaptive", action="store_true", help="enable the adaptive link controller")
+    parser.add_argument("--tk", action="store_true", help="paint through a hidden Tk root, including PhotoImage")
+    parser.add_argument("--json", help="write the full results to this file")
+    args = parser.parse_args()
+
+    config.CAMERA_RESOLUTION = args.resolution
+    config.CAMERA_COLOR_SPACE = args.color_space
+    config.CAMERA_FPS = args.fps
+    config.CAMERA_ADAPTIVE = args.adaptive
+
+    video = FakeVideoDevice(args.source, args.latency, args.jitter, args.bandwidth)
+    # Encode the replayed frames up front, not inside the first engine's startup and memory figures
+    settings = [(args.resolution, args.color_space)]
+    if args.adaptive:
+        settings += [(level[0], level[1]) for level in config.CAMERA_ADAPTIVE_LEVELS]
+    for resolution, color_space in settings:
+        video.preload(resolution, color_space)
+    results = []
+    for engine in args.engines.split(","):
+        result = run_scenario(video, engine.strip(), args.seconds, args.warmup, args.tk, args.rpc_latency)
+        _print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,289 @@ Handles camera operations for NAO robot with optimized FPS
 
 import time
 import threading
-import collections
 from PIL import Image, ImageTk
 import numpy as np
 import config
+from resize_engines import create_resizer
+from camera_metrics import CameraMetrics, image_timestamp
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None  # YUV422 frames are then converted with NumPy
+
+try:
+    from blob.detector import ShapeDetector, ShapeTracker
+except ImportError:
+    ShapeDetector = ShapeTracker = None  # Needs OpenCV; live detection is then unavailable
+
+# ALVideoDevice resolution ids and their frame sizes
+RESOLUTIONS = {
+    8: (40, 30),  # kQQQQVGA
+    7: (80, 60),  # kQQQVGA
+    0: (160, 120),  # kQQVGA
+    1: (320, 240),  # kQVGA
+    2: (640, 480),  # kVGA
+    3: (1280, 960),  # k4VGA
+}
+
+# ALVideoDevice colour spaces the pipeline can decode, and their bytes per pixel
+COLOR_SPACE_YUV422 = 9
+COLOR_SPACE_RGB = 11
+COLOR_SPACE_BGR = 13
+COLOR_SPACE_LAYERS = {
+    COLOR_SPACE_YUV422: 2,
+    COLOR_SPACE_RGB: 3,
+    COLOR_SPACE_BGR: 3,
+}
+
+
+def resolution_for_size(width, height):
+    """Return the ALVideoDevice resolution id for an exact frame size, or None"""
+    for resolution, size in RESOLUTIONS.items():
+        if size == (width, height):
+            return resolution
+    return None
+
+
+def frame_from_image(image):
+    """Wrap the binary payload of a getImageRemote result in an HxWxC uint8 view (no copy)"""
+    # Image format is [width, height, layers, colorspace, timestamp_s, timestamp_us, binary data, ...]
+    width, height, layers = image[0], image[1], image[2]
+    return np.frombuffer(image[6], dtype=np.uint8).reshape(height, width, layers)
+
+
+def decode_image(image, out=None):
+    """Turn a getImageRemote result into an HxWx3 RGB array
+
+    RGB payloads are returned as a view without copying. Other colour spaces
+    are converted into out, which is allocated if missing or the wrong shape.
+    """
+    frame = frame_from_image(image)
+    color_space = image[3]
+    if color_space == COLOR_SPACE_RGB:
+        return frame
+
+    shape = (image[1], image[0], 3)
+    if out is None or out.shape != shape:
+        out = np.empty(shape, np.uint8)
+    if color_space == COLOR_SPACE_BGR:
+        np.copyto(out, frame[:, :, ::-1])
+    elif color_space == COLOR_SPACE_YUV422:
+        _yuv422_to_rgb(frame, out)
+    else:
+        raise ValueError(f"Unsupported colour space: {color_space}")
+    return out
+
+
+def _yuv422_to_rgb(frame, out):
+    """Convert an HxWx2 YUYV frame (Y0 U Y1 V) to RGB"""
+    if cv2 is not None:
+        cv2.cvtColor(frame, cv2.COLOR_YUV2RGB_YUYV, dst=out)
+        return
+    y = frame[:, :, 0].astype(np.float32)
+    chroma = frame[:, :, 1].astype(np.float32) - 128.0
+    # Each U/V pair is shared by two neighbouring pixels
+    u = np.repeat(chroma[:, 0::2], 2, axis=1)
+    v = np.repeat(chroma[:, 1::2], 2, axis=1)
+    out[:, :, 0] = np.clip(y + 1.402 * v, 0, 255)
+    out[:, :, 1] = np.clip(y - 0.344 * u - 0.714 * v, 0, 255)
+    out[:, :, 2] = np.clip(y + 1.772 * u, 0, 255)
+
+
+def frame_bytes(settings):
+    """Size in bytes of one frame for (resolution, colour space, fps) settings"""
+    resolution, color_space = settings[0], settings[1]
+    width, height = RESOLUTIONS[resolution]
+    return width * height * COLOR_SPACE_LAYERS.get(color_space, 3)
+
+
+class LinkAdapter:
+    """Steps camera settings along a quality ladder to fit the link
+
+    Two measurements are taken over windows of window seconds, so a stalled
+    link that only delivers a few frames per second is noticed as quickly
+    as a fast one: the mean fetch latency, and the throughput in bytes per
+    second of fetch time. A level is too much for the link when its fetches
+    take longer than latency_budget, when its frames per second times frame
+    size would keep the link busier than max_load of the measured throughput,
+    or when most fetches in the window fail. Failed and empty fetches count
+    with 0 bytes, so a stalling link drags the throughput down too.
+
+    Quality drops after down_windows such windows. A latency problem skips
+    levels that only lower the frame rate, since those do not shrink a
+    fetch; a load problem takes one step. Quality only rises again after
+    up_windows windows in which the next level up is predicted to fit with
+    room to spare, so a noisy link does not make the stream flap.
+    """
+
+    def __init__(self, levels, latency_budget, start_level=0, window=0.5, down_windows=2, up_windows=5,
+                 max_load=0.8):
+        self.levels = levels  # (resolution, colour space, fps), best first
+        self.level = start_level
+        self.latency_budget = latency_budget
+        self.max_load = max_load  # Fraction of the measured throughput the stream may use
+        self.window = window  # seconds
+        self.down_windows = down_windows
+        self.up_windows = up_windows
+
+        self.window_start = None
+        self.samples = 0
+        self.failures = 0
+        self.latency_total = 0.0
+        self.bytes_total = 0
+        self.over_budget = 0
+        self.under_budget = 0
+
+        # Last completed window, also for display
+        self.mean_latency = 0.0
+        self.throughput = 0.0  # bytes per second of fetch time
+        self.load = 0.0  # bytes per second the current level needs, over throughput
+
+    def current(self):
+        """Settings for the current level"""
+        return self.levels[self.level]
+
+    def record(self, latency, nbytes, failed=False):
+        """Add one fetch measurement; returns the new settings if the level changed
+
+        A failed or empty fetch is recorded with failed set and 0 bytes.
+        """
+        now = time.time()
+        if self.window_start is None:
+            # The first fetch of a window started this long ago
+            self.window_start = now - latency
+        self.samples += 1
+        self.failures += 1 if failed else 0
+        self.latency_total += latency
+        self.bytes_total += nbytes
+        if now - self.window_start < self.window:
+            return None
+
+        stalled = self.failures * 2 > self.samples
+        self.mean_latency = self.latency_total / self.samples
+        self.throughput = self.bytes_total / max(self.latency_total, 1e-6)
+        self.load = self._load(self.level)
+        self.window_start = None
+        self.samples = 0
+        self.failures = 0
+        self.latency_total = 0.0
+        self.bytes_total = 0
+
+        slow = stalled or self.mean_latency > self.latency_budget
+        if slow or self.load > self.max_load:
+            self.under_budget = 0
+            self.over_budget += 1
+            if self.over_budget >= self.down_windows and self.level < len(self.levels) - 1:
+                return self._step(self._lower_level(slow))
+        elif self.level > 0 and self._predicted_latency(self.level - 1) < 0.5 * self.latency_budget \
+                and self._load(self.level - 1) < 0.5 * self.max_load:
+            self.over_budget = 0
+            self.under_budget += 1
+            if self.under_budget >= self.up_windows:
+                return self._step(self.level - 1)
+        else:
+            self.over_budget = 0
+            self.under_budget = 0
+        return None
+
+    def _lower_level(self, slow):
+        # Fewer frames per second only lighten the link, a slow fetch needs a smaller frame
+        level = self.level + 1
+        if slow:
+            size = frame_bytes(self.current())
+            while level < len(self.levels) - 1 and frame_bytes(self.levels[level]) >= size:
+                level += 1
+        return level
+
+    def _load(self, level):
+        # Share of the link the level would keep busy
+        if not self.throughput:
+            return float("inf")
+        settings = self.levels[level]
+        return frame_bytes(settings) * settings[2] / self.throughput
+
+    def _predicted_latency(self, level):
+        # Fetch time of the level's frame at the measured throughput; per-call overhead
+        # lowers the throughput seen for small frames, which keeps the estimate cautious
+        if not self.throughput:
+            return float("inf")
+        return frame_bytes(self.levels[level]) / self.throughput
+
+    def _step(self, level):
+        self.level = level
+        self.over_budget = 0
+        self.under_budget = 0
+        load = f"{self.load:.0%} load" if self.throughput else "no frames"
+        print(f"Camera link: {self.mean_latency * 1000:.0f} ms/frame, {self.throughput / 1e6:.2f} MB/s"
+              f" ({load}), switching to {self.current()}")
+        return self.current()
+
+
+class FrameBufferPool:
+    """Recycles frame arrays handed from one pipeline stage to the next"""
+
+    def __init__(self, shape, size=4):
+        self.shape = shape
+        self.size = size
+        self.lock = threading.Lock()
+        self.free = [np.empty(shape, np.uint8) for _ in range(size)]
+
+    def acquire(self):
+        """Take a free buffer, allocating one only if all of them are in use"""
+        with self.lock:
+            if self.free:
+                return self.free.pop()
+        return np.empty(self.shape, np.uint8)
+
+    def release(self, buffer):
+        """Return a buffer to the pool; frames the pool does not own are ignored"""
+        if buffer is None or buffer.shape != self.shape or not buffer.flags.writeable:
+            return
+        with self.lock:
+            if len(self.free) < self.size:
+                self.free.append(buffer)
+
+
+class LatestFrameSlot:
+    """Hands the newest frame from a producer thread to a consumer, dropping by policy"""
+
+    def __init__(self, policy="newest"):
+        # "newest" replaces a frame the consumer has not taken yet,
+        # "oldest" keeps the pending frame and refuses the incoming one
+        self.policy = policy
+        self.condition = threading.Condition()
+        self.frame = None
+        self.sequence = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        """Offer a frame to the consumer; returns the frame that was dropped, if any"""
+        with self.condition:
+            dropped = None
+            if self.frame is not None:
+                self.dropped += 1
+                if self.policy == "oldest":
+                    return frame
+                dropped = self.frame
+            self.frame = frame
+            self.sequence += 1
+            self.condition.notify()
+            return dropped
+
+    def take(self, timeout=None):
+        """Remove and return the pending frame, waiting up to timeout seconds for one"""
+        with self.condition:
+            if self.frame is None and timeout:
+                self.condition.wait(timeout)
+            frame = self.frame
+            self.frame = None
+            return frame
+
+    def clear(self):
+        """Discard the pending frame, if any"""
+        return self.take()
+
 
 class CameraController:
     def __init__(self, robot_controller):
@@ -21,20 +300,59 @@ class CameraController:
         self.update_callback = None
         self.camera_id = 0
         
-        # Frame buffer for smoother playback
-        self.frame_buffer = collections.deque(maxlen=10)  # Increased buffer size
-        self.buffer_lock = threading.Lock()
+        # Pipeline: capture -> raw_slot -> resize worker -> display_slot -> display
+        #                   -> detection_slot -> detection worker -> subscribers
+        # Each slot holds one frame, frames a stage has not picked up yet are dropped
+        # display_slot holds (frame, robot capture timestamp) pairs
+        self.raw_slot = LatestFrameSlot("newest")
+        self.display_slot = LatestFrameSlot(config.CAMERA_DROP_POLICY)
+        self.resize_thread = None
+        self.display_thread = None
+
+        # Optional shape detection, on the newest full-size frame only
+        self.detection_enabled = config.DETECTION_ENABLED
+        self.detection_slot = LatestFrameSlot("newest")
+        self.detection_thread = None
+        self.detection_subscribers = []
+        self.detector = None
+        self.tracker = None  # Set when config.DETECTION_TRACK follows a single target
+        self.detection_buffer = None
+        self.latest_detections = None
+        # Held while publishing detections, so none arrive after set_detection(False) returns
+        self.detection_lock = threading.Lock()
         
-        # FPS tracking
-        self.fps = 0
-        self.frame_count = 0
-        self.last_fps_time = time.time()
+        # Tk root used to paint frames on the Tk thread
+        self.tk_root = None
+        self.display_job = None
         
-        # Last displayed frame time to control display rate
-        self.last_display_time = 0
+        # Per-stage latency, frame counters and painted FPS
+        self.metrics = CameraMetrics()
+
+        # Resized frames are written into pooled buffers so nothing is reallocated per frame
+        self.resizer = create_resizer(
+            config.CAMERA_RESIZE_ENGINE, config.CAMERA_DISPLAY_WIDTH, config.CAMERA_DISPLAY_HEIGHT
+        )
+        self.buffer_pool = FrameBufferPool(
+            (config.CAMERA_DISPLAY_HEIGHT, config.CAMERA_DISPLAY_WIDTH, 3)
+        )
+
+        # Most recent image from the robot, used to serve snapshots without a new subscription
+        self.latest_image = None
+        self.latest_frame_time = 0
+
+        # Current (resolution, colour space, fps) of the stream
+        self.stream_settings = None
+        self.adapter = None
+        self.decode_buffer = None
     
-    def start(self, update_callback=None):
-        """Start the camera feed"""
+    def start(self, update_callback=None, tk_root=None):
+        """Start the camera feed
+
+        With a tk_root the callback is run on the Tk thread through root.after
+        and receives an ImageTk.PhotoImage. Without one it is run from a display
+        thread that wakes on new frames and receives the resized RGB array,
+        which is only valid for the duration of the call.
+        """
         if not self.robot_controller.nao or not self.robot_controller.nao.services.get("video"):
             return False
             
@@ -42,15 +360,27 @@ class CameraController:
             return True  # Already running
             
         self.update_callback = update_callback
+        self.tk_root = tk_root
+        self.metrics.reset()
         self.running = True
         
         # Start the camera thread
         self.thread = threading.Thread(target=self._camera_capture_loop)
         self.thread.daemon = True
         self.thread.start()
+
+        # Start the resize worker
+        self.resize_thread = threading.Thread(target=self._resize_loop)
+        self.resize_thread.daemon = True
+        self.resize_thread.start()
+
+        if self.detection_enabled:
+            self._start_detection()
         
-        # Start the display thread if callback provided
-        if self.update_callback:
+        # Hand frames to the display if callback provided
+        if self.update_callback and self.tk_root:
+            self.display_job = self.tk_root.after(0, self._pump_display)
+        elif self.update_callback:
             self.display_thread = threading.Thread(target=self._display_loop)
             self.display_thread.daemon = True
             self.display_thread.start()
@@ -64,143 +394,355 @@ class CameraController:
         if self.thread:
             self.thread.join(timeout=1.0)
             self.thread = None
+
+        if self.resize_thread:
+            self.resize_thread.join(timeout=1.0)
+            self.resize_thread = None
             
-        if hasattr(self, 'display_thread') and self.display_thread:
+        if self.display_thread:
             self.display_thread.join(timeout=1.0)
             self.display_thread = None
-            
-        if self.video_client and self.robot_controller.nao.services.get("video"):
+
+        if self.detection_thread:
+            self.detection_thread.join(timeout=1.0)
+            self.detection_thread = None
+
+        if self.display_job:
             try:
-                video_proxy = self.robot_controller.nao.services.get("video")
-                video_proxy.unsubscribe(self.video_client)
-            except:
-                pass
+                self.tk_root.after_cancel(self.display_job)
+            except Exception:
+                pass  # The Tk root may already be destroyed
+            self.display_job = None
+            
+        if self.video_client:
+            self.robot_controller.nao.camera_subscriptions.release(self.video_client)
             self.video_client = None
             
         self.current_image = None
-        with self.buffer_lock:
-            self.frame_buffer.clear()
+        self.latest_image = None
+        self.latest_detections = None
+        self.raw_slot.clear()
+        self.detection_slot.clear()
+        self._release_display_item(self.display_slot.clear())
             
         return True
     
     def get_current_fps(self):
-        """Get the current FPS rate"""
-        return self.fps
+        """Get the current FPS rate, counting only frames that were painted"""
+        return self.metrics.fps()
+
+    def get_metrics(self):
+        """Pipeline metrics as a JSON-serialisable dict, for the GUI and the CLI"""
+        metrics = self.metrics.snapshot()
+        metrics["counters"]["dropped_raw"] = self.raw_slot.dropped
+        metrics["counters"]["dropped_display"] = self.display_slot.dropped
+        metrics["counters"]["dropped_detect"] = self.detection_slot.dropped
+        metrics["stream_settings"] = self.stream_settings
+        if self.tracker:
+            metrics["tracking"] = dict(self.tracker.counters)
+        if self.adapter:
+            metrics["link"] = {
+                "level": self.adapter.level,
+                "mean_fetch_ms": round(self.adapter.mean_latency * 1000.0, 2),
+                "throughput_bps": int(self.adapter.throughput),
+                "load": round(self.adapter.load, 2) if self.adapter.throughput else None,
+            }
+        return metrics
+
+    def set_detection(self, enabled):
+        """Turn live shape detection on or off; returns False if it is unavailable"""
+        if enabled and ShapeDetector is None:
+            print("Shape detection needs OpenCV (cv2), which is not installed")
+            return False
+        if not enabled:
+            with self.detection_lock:
+                self.detection_enabled = False
+                self.latest_detections = None
+            self.detection_slot.clear()
+            return True
+        self.detection_enabled = True
+        if self.running and not (self.detection_thread and self.detection_thread.is_alive()):
+            self._start_detection()
+        return True
+
+    def subscribe_detections(self, callback):
+        """Call callback(detections) from the detection thread for every processed frame
+
+        detections is a dict with the robot capture "timestamp", the frame
+        "size" (width, height) the coordinates refer to, and the "objects"
+        found, as returned by blob.detector.ShapeDetector.detect. While
+        tracking, objects holds just the tracked target, if it is in view.
+        """
+        self.detection_subscribers.append(callback)
+
+    def get_detections(self):
+        """Result of the most recent detection, or None"""
+        return self.latest_detections
+
+    def get_latest_frame(self, camera_id=0, max_age=1.0):
+        """Get the newest full-size RGB frame from the stream, or None if it is not usable"""
+        image = self.latest_image
+        if not self.running or image is None or camera_id != self.camera_id:
+            return None
+        if self.stream_settings[0] != config.CAMERA_RESOLUTION:
+            return None  # The stream is running smaller, snapshots need a full frame
+        if time.time() - self.latest_frame_time > max_age:
+            return None
+        return decode_image(image)
     
+    def capture_resolution(self):
+        """Resolution to subscribe at; the display size itself when only the preview is needed"""
+        if config.CAMERA_PREVIEW_ONLY:
+            preview = resolution_for_size(config.CAMERA_DISPLAY_WIDTH, config.CAMERA_DISPLAY_HEIGHT)
+            if preview is not None:
+                return preview
+        return config.CAMERA_RESOLUTION
+
+    def _initial_settings(self):
+        """Stream settings to start with, creating the adaptive controller if enabled"""
+        settings = (self.capture_resolution(), config.CAMERA_COLOR_SPACE, config.CAMERA_FPS)
+        if not config.CAMERA_ADAPTIVE:
+            self.adapter = None
+            return settings
+
+        levels = list(config.CAMERA_ADAPTIVE_LEVELS)
+        if config.CAMERA_PREVIEW_ONLY:
+            # Never climb above the preview size, the display would only shrink the frames again
+            width, height = RESOLUTIONS[settings[0]]
+            levels = [level for level in levels
+                      if RESOLUTIONS[level[0]][0] * RESOLUTIONS[level[0]][1] <= width * height] or [settings]
+        start_level = levels.index(settings) if settings in levels else 0
+        self.adapter = LinkAdapter(levels, config.CAMERA_LATENCY_BUDGET, start_level,
+                                   max_load=config.CAMERA_LINK_MAX_LOAD)
+        return self.adapter.current()
+
+    def _subscribe(self, video_proxy, settings):
+        """Acquire a handle for the given settings and apply the camera parameters"""
+        resolution, color_space, fps = settings
+        # Subscribe through the shared manager so snapshots can reuse this handle
+        handle = self.robot_controller.nao.camera_subscriptions.acquire(
+            self.camera_id, resolution, color_space, fps
+        )
+        
+        # Set camera parameters for better performance
+        try:
+            video_proxy.setParameter(handle, "Contrast", 64)
+            video_proxy.setParameter(handle, "Brightness", 64)
+            video_proxy.setParameter(handle, "Saturation", 128)
+            video_proxy.setParameter(handle, "Sharpness", 0)
+            # Disable auto exposure to reduce flicker
+            video_proxy.setParameter(handle, "AutoExposition", 0)
+            # Fixed exposure to reduce flicker
+            video_proxy.setParameter(handle, "Exposure", 80)
+        except Exception as e:
+            print(f"Camera parameter error: {e}")
+            # Continue anyway, parameters might not be available
+
+        self.stream_settings = settings
+        return handle
+
+    def _switch_settings(self, video_proxy, settings):
+        """Move the stream to new settings, subscribing before the old handle is dropped"""
+        old_client = self.video_client
+        self.video_client = self._subscribe(video_proxy, settings)
+        self.robot_controller.nao.camera_subscriptions.release(old_client)
+
     def _camera_capture_loop(self):
         """Camera capture loop that runs in a separate thread"""
         try:
-            video_proxy = self.robot_controller.nao.services.get("video")
-            
-            # Subscribe to the camera with optimized parameters - using only top camera (0)
-            self.video_client = video_proxy.subscribe(
-                "python_client", 
-                config.CAMERA_RESOLUTION, 
-                config.CAMERA_COLOR_SPACE, 
-                config.CAMERA_FPS
-            )
-            
-            # Set camera parameters for better performance
-            try:
-                video_proxy.setParameter(self.video_client, "Contrast", 64)
-                video_proxy.setParameter(self.video_client, "Brightness", 64)
-                video_proxy.setParameter(self.video_client, "Saturation", 128)
-                video_proxy.setParameter(self.video_client, "Sharpness", 0)
-                # Disable auto exposure to reduce flicker
-                video_proxy.setParameter(self.video_client, "AutoExposition", 0)
-                # Fixed exposure to reduce flicker
-                video_proxy.setParameter(self.video_client, "Exposure", 80)
-            except Exception as e:
-                print(f"Camera parameter error: {e}")
-                # Continue anyway, parameters might not be available
-            
-            last_image = None
+            nao = self.robot_controller.nao
+            video_proxy = nao.services.get("video")
+            self.video_client = self._subscribe(video_proxy, self._initial_settings())
+            generation = nao.session_manager.generation
+            failures = 0  # Consecutive failed fetches, reported once per streak
             
             while self.running:
                 try:
-                    # Update FPS counter
-                    self.frame_count += 1
-                    current_time = time.time()
-                    if current_time - self.last_fps_time >= 1.0:
-                        self.fps = self.frame_count
-                        self.frame_count = 0
-                        self.last_fps_time = current_time
-                    
+                    if generation != nao.session_manager.generation:
+                        # Reconnected: the old proxy and subscription went with the old session
+                        generation = nao.session_manager.generation
+                        video_proxy = nao.services.get("video")
+                        self.video_client = self._subscribe(video_proxy, self.stream_settings)
+                    elif not nao.is_connected():
+                        time.sleep(0.1)
+                        continue
+                    elif self.adapter and self.adapter.current() != self.stream_settings:
+                        # The adapter changed level, possibly on a failed fetch
+                        self._switch_settings(video_proxy, self.adapter.current())
+
                     # Get a camera image
-                    image = video_proxy.getImageRemote(self.video_client)
+                    fetch_start = time.time()
+                    try:
+                        image = video_proxy.getImageRemote(self.video_client)
+                    except Exception:
+                        # A stalling link has to fill the adapter's windows and the metrics as well
+                        if self.adapter:
+                            self.adapter.record(time.time() - fetch_start, 0, failed=True)
+                        self.metrics.record_fetch(None, time.time() - fetch_start)
+                        raise
+                    fetch_time = time.time() - fetch_start
+                    if self.adapter:
+                        self.adapter.record(fetch_time, len(image[6]) if image else 0, failed=not image)
                     
-                    if image:
-                        # Extract image data
-                        width = image[0]
-                        height = image[1]
-                        image_data = image[6]
-                        
-                        # Create PIL image
-                        pil_image = Image.frombytes("RGB", (width, height), str(image_data))
-                        pil_image = pil_image.resize(
-                            (config.CAMERA_DISPLAY_WIDTH, config.CAMERA_DISPLAY_HEIGHT), 
-                            Image.ANTIALIAS
-                        )
-                        
-                        # Convert to PhotoImage
-                        tk_image = ImageTk.PhotoImage(pil_image)
-                        last_image = tk_image
-                        
-                        # Add to buffer (with thread safety)
-                        with self.buffer_lock:
-                            self.frame_buffer.append(tk_image)
-                    elif last_image:
-                        # If no new image but we have a previous one, reuse it
-                        # This prevents black frames during temporary camera hiccups
-                        with self.buffer_lock:
-                            self.frame_buffer.append(last_image)
+                    # Missed fetches and repeats of the last frame are counted, not passed on
+                    if self.metrics.record_fetch(image, fetch_time):
+                        # Hand the payload to the decode/resize worker without copying
+                        # On a missed fetch the display simply keeps the previous frame
+                        self.latest_image = image
+                        self.latest_frame_time = time.time()
+                        self.raw_slot.put(image)
+                        if self.detection_enabled:
+                            self.detection_slot.put(image)
                     
                     # Release resources
                     video_proxy.releaseImage(self.video_client)
+                    if failures:
+                        print(f"Camera frames resumed after {failures} failures")
+                        failures = 0
                     
-                    # Sleep to control capture rate (smaller interval = smoother capture)
-                    time.sleep(0.005)  # Target up to 200 FPS for capture
+                    # Pace the loop to the subscribed frame rate, there is nothing newer to fetch sooner
+                    interval = 1.0 / self.stream_settings[2]
+                    time.sleep(max(0.005, interval - (time.time() - fetch_start)))
                     
                 except Exception as e:
-                    print(f"Camera frame error: {e}")
+                    if not failures:
+                        print(f"Camera frame error: {e}")
+                        # Let the session manager check the link now instead of at its next heartbeat,
+                        # the is_connected() branch then waits for the reconnect without fetching
+                        nao.session_manager.report_failure()
+                    failures += 1
                     time.sleep(0.1)  # Wait before retrying
             
-            # Unsubscribe when finished
+            # Release the subscription when finished
             if self.video_client:
-                video_proxy.unsubscribe(self.video_client)
+                self.robot_controller.nao.camera_subscriptions.release(self.video_client)
                 self.video_client = None
                 
         except Exception as e:
             print(f"Camera thread error: {e}")
             self.running = False
     
+    def _resize_loop(self):
+        """Decode/resize worker that turns raw images into display-sized RGB frames"""
+        while self.running:
+            image = self.raw_slot.take(timeout=0.1)
+            if image is None:
+                continue
+            try:
+                start = time.time()
+                frame = decode_image(image, self.decode_buffer)
+                if frame.flags.writeable:
+                    self.decode_buffer = frame  # Reused for the next non-RGB image
+                decoded = time.time()
+                out = self.buffer_pool.acquire()
+                resized = self.resizer.resize(frame, out)
+                if resized is not out:
+                    # Already display-sized; the display slot only holds pool buffers
+                    np.copyto(out, resized)
+                self.metrics.record_stage("decode", decoded - start)
+                self.metrics.record_stage("resize", time.time() - decoded)
+                # A frame the display has not shown yet goes back to the pool
+                self._release_display_item(self.display_slot.put((out, image_timestamp(image))))
+            except Exception as e:
+                print(f"Camera resize error: {e}")
+
+    def _start_detection(self):
+        if ShapeDetector is None:
+            print("Shape detection needs OpenCV (cv2), which is not installed")
+            self.detection_enabled = False
+            return
+        if self.detector is None:
+            self.detector = ShapeDetector(epsilon=config.DETECTION_EPSILON, rgb=True)
+        if config.DETECTION_TRACK and self.tracker is None:
+            self.tracker = ShapeTracker(self.detector, reacquire_every=config.DETECTION_REACQUIRE_FRAMES)
+        self.detection_thread = threading.Thread(target=self._detection_loop)
+        self.detection_thread.daemon = True
+        self.detection_thread.start()
+
+    def _detection_loop(self):
+        """Detection worker; always takes the newest frame, so it skips frames when behind"""
+        while self.running and self.detection_enabled:
+            image = self.detection_slot.take(timeout=0.1)
+            if image is None:
+                continue
+            try:
+                start = time.time()
+                # Decoded into a buffer of its own, the resize worker reuses its buffer
+                frame = decode_image(image, self.detection_buffer)
+                if frame.flags.writeable:
+                    self.detection_buffer = frame
+                height, width = frame.shape[:2]
+                self.detector.min_area = config.DETECTION_MIN_AREA * width * height
+                if self.tracker is None:
+                    objects = self.detector.detect(frame)
+                else:
+                    if self.latest_detections and self.latest_detections["size"] != (width, height):
+                        self.tracker.reset()  # The stream changed resolution under the target
+                    target = self.tracker.update(frame)
+                    objects = [target] if target is not None else []
+                detections = {
+                    "timestamp": image_timestamp(image),
+                    "size": (width, height),
+                    "objects": objects,
+                }
+                self.metrics.record_stage("detect", time.time() - start)
+            except Exception as e:
+                print(f"Camera detection error: {e}")
+                continue
+
+            with self.detection_lock:
+                if not self.detection_enabled:
+                    continue  # Turned off while this frame was being processed
+                self.latest_detections = detections
+                for callback in list(self.detection_subscribers):
+                    try:
+                        callback(detections)
+                    except Exception as e:
+                        print(f"Detection subscriber error: {e}")
+
+    def _release_display_item(self, item):
+        """Return the frame of a (frame, timestamp) display item to the pool"""
+        if item is not None:
+            self.buffer_pool.release(item[0])
+
+    def _pump_display(self):
+        """Paint the pending frame, if any, on the Tk thread and reschedule"""
+        if not self.running:
+            self.display_job = None
+            return
+
+        item = self.display_slot.take()
+        if item is not None:
+            frame, timestamp = item
+            start = time.time()
+            # PhotoImages are only built here, on the Tk thread, for frames that get painted
+            pil_image = Image.fromarray(frame)
+            if self.current_image is None:
+                # Keep track of the current image to prevent garbage collection
+                self.current_image = ImageTk.PhotoImage(pil_image)
+            else:
+                # Later frames are pasted into the same PhotoImage
+                self.current_image.paste(pil_image)
+            self.buffer_pool.release(frame)
+            converted = time.time()
+            self.update_callback(self.current_image, self.metrics.fps())
+            self.metrics.record_stage("photoimage", converted - start)
+            self.metrics.record_stage("paint", time.time() - converted)
+            self.metrics.record_paint(timestamp)
+
+        self.display_job = self.tk_root.after(int(1000 / config.CAMERA_DISPLAY_FPS), self._pump_display)
+
     def _display_loop(self):
-        """Display loop that shows images from the buffer"""
-        target_fps = 30  # Target 30 FPS for display
-        display_interval = 1.0 / target_fps
-        
+        """Display loop for callers without Tk; sleeps until a new frame arrives"""
         while self.running:
-            current_time = time.time()
-            # Only update if enough time has passed since last update
-            if current_time - self.last_display_time >= display_interval:
-                self.last_display_time = current_time
-                
-                # Get a frame from the buffer (with thread safety)
-                with self.buffer_lock:
-                    if self.frame_buffer:
-                        frame = self.frame_buffer[-1]  # Get the newest frame
-                    else:
-                        frame = None
-                
-                # Update the display if we have a frame and callback
-                if frame and self.update_callback:
-                    # Keep track of the current image to prevent garbage collection
-                    self.current_image = frame
-                    # Call the UI callback with the image and current FPS
-                    self.update_callback(frame, self.fps)
-            
-            # Short sleep to prevent high CPU usage
-            time.sleep(0.001)
+            item = self.display_slot.take(timeout=0.1)
+            if item is not None:
+                frame, timestamp = item
+                start = time.time()
+                self.update_callback(frame, self.metrics.fps())
+                self.buffer_pool.release(frame)
+                self.metrics.record_stage("paint", time.time() - start)
+                self.metrics.record_paint(timestamp)
             
     # Legacy function
     def switch_camera(self, camera_id):
@@ -214,4 +756,4 @@ class CameraController:
         self.camera_id = camera_id
         
         if old_running:
-            self.start(self.update_callback)
+            self.start(self.update_callback, self.tk_root)
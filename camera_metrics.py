@@ -0,0 +1,177 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Camera Metrics
+Per-stage latency histograms and frame counters for the camera pipeline
+
+Run directly to print live metrics from the robot without the GUI:
+    python camera_metrics.py --seconds 30 --interval 1
+"""
+
+import time
+import json
+import argparse
+import threading
+import collections
+import numpy as np
+
+# Pipeline stages, in the order a frame passes through them
+STAGES = ("fetch", "decode", "resize", "photoimage", "paint", "detect")
+
+
+class RollingStat:
+    """Keeps the last window samples (seconds) and reports percentiles in milliseconds"""
+
+    def __init__(self, window=300):
+        self.samples = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.samples.append(value)
+
+    def summary(self):
+        """Count, mean, p50/p90/p99 and max of the window, in milliseconds"""
+        with self.lock:
+            values = np.array(self.samples, dtype=np.float64)
+        if not len(values):
+            return {"count": 0}
+        p50, p90, p99 = [float(p) for p in np.percentile(values, [50, 90, 99]) * 1000.0]
+        return {
+            "count": len(values),
+            "mean_ms": round(float(values.mean()) * 1000.0, 2),
+            "p50_ms": round(p50, 2),
+            "p90_ms": round(p90, 2),
+            "p99_ms": round(p99, 2),
+            "max_ms": round(float(values.max()) * 1000.0, 2),
+        }
+
+
+class CameraMetrics:
+    """Collects pipeline timings from the capture, worker and display threads
+
+    Glass-to-glass latency compares the paint time with the ALVideoDevice
+    capture timestamp (image[4] seconds, image[5] microseconds), which is on
+    the robot's clock. When the offset between the clocks has not been set
+    with set_clock_offset, it is estimated from the fastest frame seen, so
+    the reported latency then excludes the constant minimum link delay.
+    """
+
+    def __init__(self, window=300):
+        self.window = window
+        self.lock = threading.Lock()
+        self.clock_offset = None  # Robot clock minus local clock, in seconds
+        self.reset()
+
+    def reset(self):
+        """Clear all samples and counters; a measured clock offset is kept"""
+        with self.lock:
+            self.stages = dict((name, RollingStat(self.window)) for name in STAGES)
+            self.glass_to_glass = RollingStat(self.window)
+            self.counters = {
+                "fetched": 0,
+                "fetch_failures": 0,
+                "duplicates": 0,
+                "painted": 0,
+            }
+            self.paint_times = collections.deque()
+            self.last_timestamp = None
+            self.estimated_offset = None
+            self.start_time = time.time()
+            self.first_frame_latency = None
+
+    def set_clock_offset(self, offset):
+        """Use a measured robot-minus-local clock offset instead of the estimate"""
+        self.clock_offset = offset
+
+    def record_stage(self, stage, seconds):
+        self.stages[stage].add(seconds)
+
+    def record_fetch(self, image, seconds):
+        """Record a getImageRemote call; returns False for a missed or duplicate frame"""
+        self.record_stage("fetch", seconds)
+        with self.lock:
+            if not image:
+                self.counters["fetch_failures"] += 1
+                return False
+            timestamp = image_timestamp(image)
+            if timestamp == self.last_timestamp:
+                self.counters["duplicates"] += 1
+                return False
+            self.last_timestamp = timestamp
+            self.counters["fetched"] += 1
+            offset = timestamp - time.time()
+            if self.estimated_offset is None or offset > self.estimated_offset:
+                self.estimated_offset = offset
+            return True
+
+    def record_paint(self, timestamp):
+        """Record a painted frame captured at the given robot timestamp"""
+        now = time.time()
+        with self.lock:
+            self.counters["painted"] += 1
+            self.paint_times.append(now)
+            if self.first_frame_latency is None:
+                self.first_frame_latency = now - self.start_time
+            offset = self.clock_offset if self.clock_offset is not None else self.estimated_offset
+        if timestamp is not None and offset is not None:
+            self.glass_to_glass.add(now - (timestamp - offset))
+
+    def fps(self):
+        """Frames actually painted during the last second"""
+        now = time.time()
+        with self.lock:
+            while self.paint_times and now - self.paint_times[0] > 1.0:
+                self.paint_times.popleft()
+            return len(self.paint_times)
+
+    def snapshot(self):
+        """All metrics as a JSON-serialisable dict"""
+        with self.lock:
+            counters = dict(self.counters)
+            first_frame = self.first_frame_latency
+        return {
+            "fps": self.fps(),
+            "counters": counters,
+            "stages": dict((name, stat.summary()) for name, stat in self.stages.items()),
+            "glass_to_glass": self.glass_to_glass.summary(),
+            "clock_offset_measured": self.clock_offset is not None,
+            "time_to_first_frame_s": round(first_frame, 3) if first_frame is not None else None,
+        }
+
+
+def image_timestamp(image):
+    """ALVideoDevice capture time of a getImageRemote result, in seconds"""
+    return image[4] + image[5] * 1e-6
+
+
+def main():
+    import config
+    from robot_environment import NaoEnvironment
+    from robot_agent import NaoActions
+
+    parser = argparse.ArgumentParser(description="Print live camera pipeline metrics")
+    parser.add_argument("--ip", default=config.IP)
+    parser.add_argument("--port", default=config.PORT)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    nao = NaoEnvironment(args.ip, args.port)
+    if not nao.init_robot():
+        return 1
+
+    agent = NaoActions(nao)
+    # Headless: the display thread only discards frames, which counts them as painted
+    agent.start_camera(lambda frame, fps: None)
+    try:
+        end = time.time() + args.seconds
+        while time.time() < end:
+            time.sleep(args.interval)
+            print(json.dumps(agent.get_camera_metrics(), sort_keys=True))
+    finally:
+        agent.stop_camera()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,54 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Camera Subscriptions
+Keeps long-lived ALVideoDevice subscriptions shared between the stream and snapshots
+"""
+
+import threading
+
+
+class CameraSubscriptionManager:
+    def __init__(self, nao_env):
+        self.nao = nao_env
+        self.lock = threading.Lock()
+        # (camera_id, resolution, color_space, fps) -> [handle, reference count]
+        self.subscriptions = {}
+
+    def acquire(self, camera_id, resolution, color_space, fps):
+        """Return a handle for the given settings, subscribing only if nobody holds one yet"""
+        key = (camera_id, resolution, color_space, fps)
+        with self.lock:
+            entry = self.subscriptions.get(key)
+            if entry is None:
+                video = self.nao.services["video"]
+                client_name = f"python_client_{camera_id}_{resolution}_{color_space}_{fps}"
+                handle = video.subscribeCamera(client_name, camera_id, resolution, color_space, fps)
+                entry = [handle, 0]
+                self.subscriptions[key] = entry
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, handle):
+        """Drop one reference to a handle and unsubscribe once it is no longer used"""
+        with self.lock:
+            for key, entry in list(self.subscriptions.items()):
+                if entry[0] != handle:
+                    continue
+                entry[1] -= 1
+                if entry[1] <= 0:
+                    del self.subscriptions[key]
+                    self._unsubscribe(handle)
+                return
+
+    def forget_all(self):
+        """After a reconnect: try to drop the old handles and start afresh"""
+        with self.lock:
+            for handle, _ in self.subscriptions.values():
+                self._unsubscribe(handle)
+            self.subscriptions.clear()
+
+    def _unsubscribe(self, handle):
+        try:
+            self.nao.services["video"].unsubscribe(handle)
+        except Exception as e:
+            print(f"Camera unsubscribe error: {e}")
@@ -0,0 +1,491 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Choreography
+Runs a sequence of moves on one or more robots so every move starts at the
+same instant on all of them, compensating each robot's link latency
+"""
+
+import os
+import json
+import time
+import hashlib
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import config
+from camera_metrics import RollingStat
+
+try:
+    import yaml
+except ImportError:
+    yaml = None  # YAML routines need PyYAML, JSON always works
+
+ROUTINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routines")
+DANCE_FILE = os.path.join(ROUTINE_DIR, "dance.json")
+CACHE_DIR = os.path.join(ROUTINE_DIR, ".cache")
+
+# Joint groups every routine can use by name, besides its own "groups"
+JOINT_GROUPS = {
+    "head": ["HeadYaw", "HeadPitch"],
+    "larm": ["LShoulderPitch", "LShoulderRoll", "LElbowYaw", "LElbowRoll", "LWristYaw"],
+    "rarm": ["RShoulderPitch", "RShoulderRoll", "RElbowYaw", "RElbowRoll", "RWristYaw"],
+    "hands": ["LHand", "RHand"],
+}
+JOINT_GROUPS["arms"] = JOINT_GROUPS["larm"] + JOINT_GROUPS["rarm"]
+
+
+def parse_routine(data):
+    """Validate a routine dict and normalise every move to {"name", "time", "angles": {joint: angle}}
+
+    A move gives its angles either as a {joint: angle} mapping, or as a
+    list together with the "group" of joints they belong to.
+    """
+    groups = dict(JOINT_GROUPS)
+    groups.update(data.get("groups", {}))
+    if "moves" not in data:
+        raise ValueError(f"{data.get('name', 'routine')}: missing 'moves'")
+    moves = []
+    for number, move in enumerate(data["moves"]):
+        name = move.get("name", f"Move {number + 1}")
+        for key in ("angles", "time"):
+            if key not in move:
+                raise ValueError(f"{name}: missing '{key}'")
+        angles = move["angles"]
+        try:
+            seconds = float(move["time"])
+        except (TypeError, ValueError):
+            raise ValueError(f"{name}: time must be a number, not {move['time']!r}")
+        if "group" in move:
+            if move["group"] not in groups:
+                raise ValueError(f"{name}: unknown joint group '{move['group']}'")
+            joints = groups[move["group"]]
+            if len(joints) != len(angles):
+                raise ValueError(f"{name}: {len(angles)} angles for {len(joints)} joints in '{move['group']}'")
+            angles = collections.OrderedDict(zip(joints, angles))
+        if seconds <= 0:
+            raise ValueError(f"{name}: time must be positive")
+        moves.append({"name": name, "time": seconds, "angles": angles})
+    return {
+        "name": data.get("name", "routine"),
+        "stiffness": data.get("stiffness", {}),
+        "moves": moves,
+    }
+
+
+def load_routine(path):
+    """Read a routine from a JSON file, or YAML when PyYAML is installed"""
+    with open(path) as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise ImportError("PyYAML is needed to read YAML routines")
+        return parse_routine(yaml.safe_load(text))
+    return parse_routine(json.loads(text, object_pairs_hook=collections.OrderedDict))
+
+
+# Joint ranges in radians, from the NAO V5 documentation
+JOINT_LIMITS = {
+    "HeadYaw": (-2.0857, 2.0857), "HeadPitch": (-0.6720, 0.5149),
+    "LShoulderPitch": (-2.0857, 2.0857), "LShoulderRoll": (-0.3142, 1.3265),
+    "LElbowYaw": (-2.0857, 2.0857), "LElbowRoll": (-1.5446, -0.0349),
+    "LWristYaw": (-1.8238, 1.8238), "LHand": (0.0, 1.0),
+    "RShoulderPitch": (-2.0857, 2.0857), "RShoulderRoll": (-1.3265, 0.3142),
+    "RElbowYaw": (-2.0857, 2.0857), "RElbowRoll": (0.0349, 1.5446),
+    "RWristYaw": (-1.8238, 1.8238), "RHand": (0.0, 1.0),
+    "LHipYawPitch": (-1.1453, 0.7408), "LHipRoll": (-0.3795, 0.7905), "LHipPitch": (-1.5359, 0.4841),
+    "LKneePitch": (-0.0923, 2.1125), "LAnklePitch": (-1.1895, 0.9227), "LAnkleRoll": (-0.3979, 0.7690),
+    "RHipYawPitch": (-1.1453, 0.7408), "RHipRoll": (-0.7905, 0.3795), "RHipPitch": (-1.5359, 0.4841),
+    "RKneePitch": (-0.1031, 2.1202), "RAnklePitch": (-1.1864, 0.9321), "RAnkleRoll": (-0.7690, 0.3979),
+}
+MAX_JOINT_SPEED = 6.0  # rad/s, a little under the slowest NAO joint motor at full speed
+
+
+def validate_move(move, incoming):
+    """Safety issues of one move; incoming maps its joints to their angle before it, or None
+
+    Angles outside JOINT_LIMITS are "limit" issues, which stop a routine
+    from running. Moves faster than MAX_JOINT_SPEED are "speed" warnings,
+    as NAOqi slows them down rather than refusing them.
+    """
+    issues = []
+    for joint, angle in move["angles"].items():
+        if joint not in JOINT_LIMITS:
+            issues.append({"move": move["name"], "joint": joint, "kind": "limit", "detail": "unknown joint"})
+            continue
+        low, high = JOINT_LIMITS[joint]
+        if not low <= angle <= high:
+            issues.append({"move": move["name"], "joint": joint, "kind": "limit",
+                           "detail": f"{angle} outside [{low}, {high}]"})
+        previous = incoming.get(joint)
+        if previous is not None and abs(angle - previous) / move["time"] > MAX_JOINT_SPEED:
+            issues.append({"move": move["name"], "joint": joint, "kind": "speed",
+                           "detail": f"{abs(angle - previous) / move['time']:.1f} rad/s"})
+    return issues
+
+
+class CompiledRoutine:
+    """A whole routine as one multi-keyframe call: per joint, (time, angle) keyframes
+
+    late maps joints that only start moving after the first move to the
+    time they start; with_start_angles() holds them there until then.
+    """
+
+    def __init__(self, keyframes, duration, smooth=False, late=None, issues=None):
+        self.keyframes = keyframes
+        self.duration = duration
+        self.smooth = smooth
+        self.late = late or {}
+        self.issues = issues or []
+
+    def errors(self):
+        """Issues that must stop the routine from running"""
+        return [issue for issue in self.issues if issue["kind"] == "limit"]
+
+    def with_start_angles(self, start_angles):
+        """Copy holding each late joint at its current angle until its first move"""
+        keyframes = collections.OrderedDict()
+        for joint, frames in self.keyframes.items():
+            if joint in self.late and joint in start_angles:
+                frames = [(self.late[joint], start_angles[joint])] + list(frames)
+            keyframes[joint] = frames
+        return CompiledRoutine(keyframes, self.duration, self.smooth, None, self.issues)
+
+    def to_dict(self):
+        return {
+            "keyframes": [[joint, [list(frame) for frame in frames]] for joint, frames in self.keyframes.items()],
+            "duration": self.duration,
+            "smooth": self.smooth,
+            "late": self.late,
+            "issues": self.issues,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        keyframes = collections.OrderedDict(
+            (joint, [tuple(frame) for frame in frames]) for joint, frames in data["keyframes"])
+        return cls(keyframes, data["duration"], data["smooth"], data["late"], data["issues"])
+
+    def send(self, motion, **kwargs):
+        """Play the routine with a single ALMotion call; kwargs such as _async go to the call"""
+        names = list(self.keyframes)
+        times = [[t for t, _ in self.keyframes[name]] for name in names]
+        angles = [[a for _, a in self.keyframes[name]] for name in names]
+        if not self.smooth:
+            return motion.angleInterpolation(names, angles, times, True, **kwargs)
+        return motion.angleInterpolationBezier(names, times, self._control_points(times, angles), **kwargs)
+
+    def _control_points(self, times, angles):
+        ### Flat Bezier handles a third of the way to the neighbouring keyframes: ease in and out of each pose
+        points = []
+        for joint_times, joint_angles in zip(times, angles):
+            joint_points = []
+            previous = 0.0
+            for index, (t, angle) in enumerate(zip(joint_times, joint_angles)):
+                following = joint_times[index + 1] if index + 1 < len(joint_times) else t + (t - previous)
+                joint_points.append([angle, [2, -(t - previous) / 3.0, 0.0], [2, (following - t) / 3.0, 0.0]])
+                previous = t
+            points.append(joint_points)
+        return points
+
+
+def compile_routine(moves, start_angles=None, smooth=False, validations=None):
+    """Merge moves into per-joint keyframes for one angleInterpolation(Bezier) call
+
+    A joint left out of some moves gets a hold keyframe, so that it stays
+    put until the move that changes it begins, as it would with one call
+    per move. start_angles (joint -> current angle) supplies that hold for
+    joints that only start moving after the first move. validations may
+    supply validate_move(move, incoming) results, e.g. from a cache.
+    """
+    validations = validations or validate_move
+    keyframes = collections.OrderedDict()
+    last = {}  # joint -> (time, angle) of its latest keyframe
+    late = {}
+    issues = []
+    start = 0.0
+    for move in moves:
+        end = start + move["time"]
+        incoming = dict((joint, last[joint][1] if joint in last else None) for joint in move["angles"])
+        issues.extend(validations(move, incoming))
+        for joint, angle in move["angles"].items():
+            frames = keyframes.setdefault(joint, [])
+            if joint in last and last[joint][0] < start:
+                frames.append((start, last[joint][1]))
+            elif joint not in last and start > 0:
+                late[joint] = start
+            frames.append((end, angle))
+            last[joint] = (end, angle)
+        start = end
+    routine = CompiledRoutine(keyframes, start, smooth, late, issues)
+    return routine.with_start_angles(start_angles) if start_angles else routine
+
+
+class RoutineCache:
+    """Content-addressed on-disk store of compiled routines
+
+    Each routine is one JSON file named by the SHA-1 of its moves, the
+    smoothing flag and the validation rules. Per-move validation results
+    are only kept in memory, so after an edit in the same process only
+    moves whose content or starting angles changed are validated again.
+    Hits refresh an entry's modification time, and storing a new routine
+    deletes the least recently used entries beyond max_entries.
+    """
+
+    VERSION = 2  # Bump when the compiler or the validation rules change
+
+    def __init__(self, directory=None, max_entries=None):
+        self.directory = directory or CACHE_DIR
+        self.max_entries = max_entries or config.ROUTINE_CACHE_MAX_ENTRIES
+        self.validations = {}  # Move key -> validate_move issues
+        self.counters = {"hits": 0, "misses": 0, "pruned": 0}
+
+    def compile(self, moves, smooth=False):
+        """The compiled routine, without start angles, from the cache if possible"""
+        # The validation rules are part of the key, so tightened limits never hit old issues
+        key = self._key({"moves": moves, "smooth": smooth, "rules": self._rules()})
+        data = self._load(key)
+        if data is not None:
+            return CompiledRoutine.from_dict(data)
+        routine = compile_routine(moves, smooth=smooth, validations=self._validate)
+        if self._store(key, routine.to_dict()):
+            self.prune()
+        return routine
+
+    def prune(self):
+        """Delete the least recently used entries beyond max_entries"""
+        try:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                     if name.endswith(".json")]
+            if len(paths) <= self.max_entries:
+                return
+            paths.sort(key=os.path.getmtime)
+        except (IOError, OSError):
+            return
+        for path in paths[:len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+                self.counters["pruned"] += 1
+            except (IOError, OSError):
+                pass  # Already removed by another process
+
+    def _validate(self, move, incoming):
+        key = json.dumps([move, incoming], sort_keys=True)
+        issues = self.validations.get(key)
+        if issues is None:
+            issues = self.validations[key] = validate_move(move, incoming)
+        return issues
+
+    def _rules(self):
+        return {"limits": JOINT_LIMITS, "max_speed": MAX_JOINT_SPEED}
+
+    def _key(self, content):
+        text = json.dumps([self.VERSION, content], sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _load(self, key):
+        path = os.path.join(self.directory, key + ".json")
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        try:
+            os.utime(path, None)  # Recently used, kept by prune()
+        except OSError:
+            pass
+        return data
+
+    def _store(self, key, data):
+        ### Write to a temporary file first so a reader never sees half an entry; True once written
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            path = os.path.join(self.directory, key + ".json")
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(data, f)
+            os.rename(temporary, path)
+            return True
+        except (IOError, OSError) as e:
+            print(f"Could not write routine cache entry: {e}")
+            return False
+
+
+def estimate_clock(motion, samples=8):
+    """Estimate (robot clock minus local clock, round trip time) with ALMotion.getTime
+
+    NTP style: the robot read is assumed to happen halfway through the call,
+    and the sample with the shortest round trip is the most trustworthy.
+    """
+    best = None
+    for _ in range(samples):
+        sent = time.time()
+        robot_time = motion.getTime(0)
+        received = time.time()
+        rtt = received - sent
+        if best is None or rtt < best[1]:
+            best = (robot_time - (sent + received) / 2.0, rtt)
+    return best
+
+
+def perform(motion, move):
+    """Start one move without waiting for it; returns the qi future"""
+    names = list(move["angles"])
+    angles = [move["angles"][name] for name in names]
+    return motion.angleInterpolation(names, angles, [move["time"]] * len(names), True, _async=True)
+
+
+class Choreography:
+    """A timeline of moves, each starting when the previous one is due to end
+
+    run() gives every robot its own thread. Moves are sent half a round
+    trip early so that they reach every robot at the same moment. Compiled,
+    the whole routine goes out as one call at the first slot and the robot
+    keeps the time itself. Otherwise each move is its own call on an
+    absolute timeline, so a late call never delays later moves.
+    """
+
+    def __init__(self, moves, lead_time=0.5, sync_samples=8, compiled=True, smooth=False, stiffness=None,
+                 cache=None):
+        self.moves = moves
+        self.cache = cache  # RoutineCache, or None to compile every time
+        self.stiffness = stiffness or {}  # Joint or chain -> stiffness set before the start
+        self.lead_time = lead_time  # Seconds between the end of clock sync and the first move
+        self.sync_samples = sync_samples
+        self.compiled = compiled
+        self.smooth = smooth  # Compiled routines only: Bezier easing instead of linear keyframes
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Choreography of a routine file, with the routine's stiffness settings"""
+        routine = load_routine(path)
+        kwargs.setdefault("stiffness", routine["stiffness"])
+        if config.ROUTINE_CACHE:
+            kwargs.setdefault("cache", RoutineCache())
+        return cls(routine["moves"], **kwargs)
+
+    def duration(self):
+        return sum(move["time"] for move in self.moves)
+
+    def compile(self):
+        """The validated routine without start angles, through the cache when there is one"""
+        if self.cache is not None:
+            return self.cache.compile(self.moves, self.smooth)
+        return compile_routine(self.moves, smooth=self.smooth)
+
+    def run(self, motions):
+        """Dance on {name: ALMotion proxy}; returns the timing report once every robot is done
+
+        Start errors and skew are measured on each robot's clock: an
+        ALMotion.getTime call goes out right behind every move, and the
+        time it reports, less the robot's clock offset, is compared with
+        the slot on the shared timeline.
+        """
+        routine = self.compile()
+        if routine.errors():
+            raise ValueError("Routine is unsafe: " + "; ".join(
+                f"{issue['move']} {issue['joint']}: {issue['detail']}" for issue in routine.errors()))
+        for issue in routine.issues:
+            print(f"Warning: {issue['move']} {issue['joint']} moves at {issue['detail']}")
+
+        names = list(motions)
+        executor = ThreadPoolExecutor(max_workers=max(1, len(names)))
+        try:
+            prepared = dict(zip(names, executor.map(lambda name: self._prepare(motions[name], routine), names)))
+            clocks = dict((name, prepared[name][0]) for name in names)
+
+            start = time.time() + self.lead_time
+            slots = []
+            for move in self.moves:
+                slots.append(start)
+                start += move["time"]
+
+            # name -> arrival time of each move on the robot's clock minus its slot
+            errors = dict((name, [None] * len(self.moves)) for name in names)
+            futures = [
+                executor.submit(self._perform_all, motions[name], clocks[name], prepared[name][1],
+                                slots, errors[name])
+                for name in names
+            ]
+            failures = dict((name, f.result()) for name, f in zip(names, futures))
+        finally:
+            executor.shutdown(wait=False)
+        return self._report(names, clocks, slots, errors, failures)
+
+    def _prepare(self, motion, routine):
+        ### Per robot, before the start: clock estimate and, when compiling, the robot's copy of the routine
+        for chain, stiffness in self.stiffness.items():
+            motion.setStiffnesses(chain, stiffness)
+        clock = estimate_clock(motion, self.sync_samples)
+        if not self.compiled:
+            return clock, None
+        late = list(routine.late)
+        if late:
+            routine = routine.with_start_angles(dict(zip(late, motion.getAngles(late, True))))
+        return clock, routine
+
+    def _perform_all(self, motion, clock, routine, slots, errors):
+        ### Runs on the robot's thread: send every move on time, then wait for them all
+        offset, rtt = clock
+        pending = []
+        stamps = []  # (first move index, slot, getTime future sent right behind the move)
+        if routine is not None:
+            delay = slots[0] - rtt / 2.0 - time.time() if slots else 0
+            if delay > 0:
+                time.sleep(delay)
+            pending.append(routine.send(motion, _async=True))
+            stamps.append((0, slots[0] if slots else 0, motion.getTime(0, _async=True)))
+        else:
+            for index, (move, slot) in enumerate(zip(self.moves, slots)):
+                delay = slot - rtt / 2.0 - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                pending.append(perform(motion, move))
+                stamps.append((index, slot, motion.getTime(0, _async=True)))
+
+        failures = []
+        for index, slot, future in stamps:
+            if future.hasError():
+                failures.append(future.error())
+                continue
+            error = future.value() - offset - slot
+            if routine is not None:
+                # The robot plays the keyframes on its own clock, every move keeps the first one's offset
+                for move_index in range(len(slots)):
+                    errors[move_index] = error
+            else:
+                errors[index] = error
+        for future in pending:
+            if future.hasError():
+                failures.append(future.error())
+        return failures
+
+    def _report(self, names, clocks, slots, errors, failures):
+        robots = {}
+        for name in names:
+            stat = RollingStat(len(self.moves))
+            for error in errors[name]:
+                if error is not None:
+                    stat.add(abs(error))
+            robots[name] = {
+                "clock_offset_s": round(clocks[name][0], 4),
+                "rtt_ms": round(clocks[name][1] * 1000.0, 2),
+                # The first slot on the robot's own clock, as ALMotion.getTime reports it
+                "start_robot_time": round(slots[0] + clocks[name][0], 4) if slots else None,
+                "start_error": stat.summary(),
+                "errors": failures[name],
+            }
+
+        moves = []
+        for index, move in enumerate(self.moves):
+            arrivals = [errors[name][index] for name in names if errors[name][index] is not None]
+            moves.append({
+                "name": move["name"],
+                "skew_ms": round((max(arrivals) - min(arrivals)) * 1000.0, 2) if arrivals else None,
+            })
+        return {
+            "robots": robots,
+            "moves": moves,
+            "max_skew_ms": max([m["skew_ms"] for m in moves if m["skew_ms"] is not None] or [0.0]),
+        }
@@ -0,0 +1,163 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Command Coalescer
+Latest-value-wins sending of setpoints, so a slow link never builds a backlog
+of stale walk, head or posture commands
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+def _done_future(result=None):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def _same(a, b, tolerance):
+    """Compare setpoints, numbers within tolerance and anything else exactly"""
+    if isinstance(a, (tuple, list)) and isinstance(b, (tuple, list)):
+        return len(a) == len(b) and all(_same(x, y, tolerance) for x, y in zip(a, b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)) and not isinstance(a, bool):
+        return abs(a - b) <= tolerance
+    return a == b
+
+
+class _Channel:
+    def __init__(self, send, idempotent, merge):
+        self.send = send              # value -> future of the robot command
+        self.idempotent = idempotent  # Repeating the last value has no effect on the robot
+        self.merge = merge            # (pending value, new value) -> value with the effect of both, or None
+        self.last_sent = None
+        self.in_flight = None         # (value, proxy future) of the command being executed
+        self.pending = None           # (value, proxy future) waiting for in_flight to finish
+        self.queued = []              # (value, proxy future) that could not be merged, sent after pending
+
+
+class CommandCoalescer:
+    """Keeps at most one command in flight and one pending per channel
+
+    A new setpoint replaces the pending one, whose future is cancelled, so
+    only the newest value is sent once the link catches up; within
+    tolerance of the pending value it takes that value's place and future
+    instead. A setpoint equal to the one already in flight is dropped, and
+    on idempotent channels so is a repeat of the last value sent. Those
+    two compare exactly, as a dropped value would never reach the robot.
+
+    Channels of relative commands pass merge instead: every value counts,
+    and one arriving while another is pending is folded into it. When
+    merge returns None the two cannot be combined, and the new value is
+    queued to be sent after the pending one.
+    """
+
+    def __init__(self, tolerance=0.0):
+        self.tolerance = tolerance
+        # Re-entrant: a command that finishes immediately launches the next from add_done_callback
+        self.lock = threading.RLock()
+        self.channels = {}
+        self.counters = {"sent": 0, "skipped": 0, "superseded": 0, "merged": 0}
+
+    def add_channel(self, name, send, idempotent=True, merge=None):
+        self.channels[name] = _Channel(send, idempotent and merge is None, merge)
+
+    def send(self, name, value):
+        """Queue value on the channel; returns a future of the command's result
+
+        The future resolves to None straight away when the value is skipped,
+        and is cancelled if a newer value supersedes it before it is sent.
+        """
+        channel = self.channels[name]
+        with self.lock:
+            if channel.merge is not None:
+                if channel.pending is not None:
+                    return self._merge(channel, value)
+            elif channel.pending is not None:
+                if _same(value, channel.pending[0], self.tolerance):
+                    # Still unsent, so the newer value goes out in its place under the same future
+                    channel.pending = (value, channel.pending[1])
+                    self.counters["skipped"] += 1
+                    return channel.pending[1]
+                channel.pending[1].cancel()
+                self.counters["superseded"] += 1
+            elif channel.in_flight is not None:
+                if value == channel.in_flight[0]:
+                    self.counters["skipped"] += 1
+                    return channel.in_flight[1]
+            elif channel.idempotent and value == channel.last_sent:
+                self.counters["skipped"] += 1
+                return _done_future()
+
+            proxy = Future()
+            channel.pending = (value, proxy)
+            if channel.in_flight is None:
+                return self._launch(name, channel)
+            return proxy
+
+    def _merge(self, channel, value):
+        # Called with the lock held; folds value into the last command waiting to be sent
+        last = channel.queued[-1] if channel.queued else channel.pending
+        merged = channel.merge(last[0], value)
+        if merged is None:
+            proxy = Future()
+            channel.queued.append((value, proxy))
+            return proxy
+        self.counters["merged"] += 1
+        if channel.queued:
+            channel.queued[-1] = (merged, last[1])
+        else:
+            channel.pending = (merged, last[1])
+        return last[1]
+
+    def clear(self, name=None):
+        """Forget pending setpoints, so the next value is always sent"""
+        with self.lock:
+            names = [name] if name is not None else list(self.channels)
+            for channel_name in names:
+                channel = self.channels[channel_name]
+                if channel.pending is not None:
+                    channel.pending[1].cancel()
+                    channel.pending = None
+                for value, proxy in channel.queued:
+                    proxy.cancel()
+                channel.queued = []
+                channel.last_sent = None
+
+    def _launch(self, name, channel):
+        # Called with the lock held; sends the pending value
+        value, proxy = channel.pending
+        # The next queued value waits as pending, so new ones merge behind it
+        channel.pending = channel.queued.pop(0) if channel.queued else None
+        if proxy.cancelled():
+            if channel.pending is not None:
+                self._launch(name, channel)
+            return proxy
+        try:
+            future = channel.send(value)
+        except Exception as e:
+            proxy.set_exception(e)
+            if channel.pending is not None:
+                self._launch(name, channel)
+            return proxy
+        channel.last_sent = value
+        channel.in_flight = (value, proxy)
+        self.counters["sent"] += 1
+        future.add_done_callback(lambda f: self._finished(name, channel, f, proxy))
+        return proxy
+
+    def _finished(self, name, channel, future, proxy):
+        if proxy.cancelled():
+            pass
+        elif future.cancelled():
+            proxy.cancel()
+        elif future.exception() is not None:
+            proxy.set_exception(future.exception())
+        else:
+            proxy.set_result(future.result())
+        with self.lock:
+            channel.in_flight = None
+            if future.cancelled() or future.exception() is not None:
+                # The robot may not be where we think, resend next time
+                channel.last_sent = None
+            if channel.pending is not None:
+                self._launch(name, channel)
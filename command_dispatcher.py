@@ -0,0 +1,92 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Command Dispatcher
+Runs NAOqi calls on per-channel worker threads so callers get a future back
+immediately instead of waiting for the robot
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CommandDispatcher:
+    """One single-threaded executor per channel
+
+    Commands on the same channel run in submission order, while a long
+    goToPosture or say on one channel never holds up another. Each channel
+    may have a stop hook that interrupts the behaviour currently running
+    on the robot when the channel is cancelled. Stop hooks are NAOqi calls
+    themselves, so they run on a pool of their own and cancel() never
+    waits for the robot either.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executors = {}
+        self.pending = {}     # channel -> set of futures not finished yet
+        self.stop_hooks = {}  # channel -> callable interrupting the running behaviour
+        # One thread per stop hook at most, so a stalled stopMove never delays stopAll
+        self.stop_executor = ThreadPoolExecutor(max_workers=4)
+
+    def set_stop_hook(self, channel, hook):
+        self.stop_hooks[channel] = hook
+
+    def submit(self, channel, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the channel's thread and return a future"""
+        with self.lock:
+            executor = self.executors.get(channel)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=1)
+                self.executors[channel] = executor
+            future = executor.submit(fn, *args, **kwargs)
+            self.pending.setdefault(channel, set()).add(future)
+        future.add_done_callback(lambda f: self._finished(channel, f))
+        return future
+
+    def cancel(self, channel=None, interrupt=True):
+        """Drop queued commands and interrupt the running one, on one or all channels
+
+        Queued commands are cancelled before this returns; stop hooks are
+        only started, and return futures of their own.
+        """
+        channels = [channel] if channel is not None else list(self.executors)
+        stops = []
+        for name in channels:
+            with self.lock:
+                futures = list(self.pending.get(name, ()))
+            for future in futures:
+                future.cancel()
+            hook = self.stop_hooks.get(name)
+            if interrupt and hook is not None and any(f.running() for f in futures):
+                try:
+                    stops.append(self.stop_executor.submit(self._stop, name, hook))
+                except RuntimeError:
+                    pass  # Shut down already, nothing left to interrupt
+        return stops
+
+    def busy(self, channel):
+        """True while the channel has a command queued or running"""
+        with self.lock:
+            return bool(self.pending.get(channel))
+
+    def shutdown(self, wait=True):
+        """Cancel everything and stop the worker threads"""
+        self.cancel()
+        with self.lock:
+            executors = list(self.executors.values())
+            self.executors.clear()
+        for executor in executors:
+            executor.shutdown(wait=wait)
+        self.stop_executor.shutdown(wait=wait)
+
+    def _stop(self, channel, hook):
+        try:
+            hook()
+        except Exception as e:
+            print(f"ERROR: Could not stop '{channel}' command: {e}")
+
+    def _finished(self, channel, future):
+        with self.lock:
+            self.pending.get(channel, set()).discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            print(f"ERROR: '{channel}' command failed: {future.exception()}")
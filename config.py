@@ -1,9 +1,79 @@
 IP = "169.254.81.31"
 PORT = "9559"
 
+# Robots driven by fleet.NaoFleet: (name, ip, port)
+ROBOTS = [
+    ("nao", IP, PORT),
+]
+FLEET_CONCURRENCY = 8  # Robots a fleet command is sent to at the same time
+ROUTINE_CACHE = False  # Keep compiled routines in routines/.cache; compiling takes well under a millisecond, a hit longer
+ROUTINE_CACHE_MAX_ENTRIES = 2000  # Routines kept when ROUTINE_CACHE is on, the least recently used go first; unused while it is off
+
+# Run against fake_naoqi.FakeSession instead of a robot
+SIMULATE = False
+SIMULATED_LATENCY = 0.01  # Seconds per simulated NAOqi call
+SIMULATED_JITTER = 0.005  # Extra random seconds per simulated NAOqi call
+
 # Camera settings
 CAMERA_RESOLUTION = 2  # 2 = 640x480
 CAMERA_COLOR_SPACE = 11  # 11 = RGB
 CAMERA_FPS = 30  # Target FPS for camera capture
+
+# Adaptive camera quality: step resolution/colour space/FPS to hold a fetch latency budget
+CAMERA_ADAPTIVE = True
+CAMERA_LATENCY_BUDGET = 0.06  # Seconds per getImageRemote the stream should stay under
+CAMERA_LINK_MAX_LOAD = 0.8  # Share of the measured link throughput (bytes/s) the stream may use
+# Quality ladder, best first: (resolution, colour space, fps); 9 = YUV422, 11 = RGB
+# Each step must need fewer bytes/s; fps-only steps ease a loaded link, smaller frames a slow fetch
+CAMERA_ADAPTIVE_LEVELS = [
+    (2, 11, 30),
+    (2, 9, 30),
+    (1, 11, 30),
+    (1, 9, 30),
+    (1, 9, 15),
+    (0, 9, 30),
+    (0, 9, 15),
+    (0, 9, 5),
+]
 CAMERA_DISPLAY_WIDTH = 320
 CAMERA_DISPLAY_HEIGHT = 240
+CAMERA_RESIZE_ENGINE = "auto"  # "auto" ("opencv" if installed, else "reduce"), "box" (NumPy), "reduce" (Pillow), "opencv" (INTER_AREA) or "pillow"
+CAMERA_PREVIEW_ONLY = False  # Ask the robot for display-sized (QVGA) frames and skip resizing
+CAMERA_DISPLAY_FPS = 30  # Rate at which the Tk thread checks for a new frame
+CAMERA_DROP_POLICY = "newest"  # "newest" replaces an unshown frame, "oldest" keeps it
+
+# Live colour/shape detection on the camera stream (needs OpenCV)
+DETECTION_ENABLED = False
+DETECTION_MIN_AREA = 0.0002  # Fraction of the frame a shape must cover, as blob/ uses on its photos
+DETECTION_EPSILON = 0.04  # Outline simplification, as a fraction of the perimeter
+DETECTION_TRACK = False  # Follow the largest shape in a window around its last position instead of scanning every frame
+DETECTION_REACQUIRE_FRAMES = 30  # Frames between full-frame searches while tracking
+
+# Snapshot encoding
+SNAPSHOT_FORMAT = "jpeg"  # "jpeg", "png" or "raw"
+SNAPSHOT_QUALITY = 85  # JPEG quality (1-95)
+SNAPSHOT_SUBSAMPLING = 2  # JPEG chroma subsampling: 0 = 4:4:4, 1 = 4:2:2, 2 = 4:2:0
+SNAPSHOT_PNG_COMPRESSION = 1  # zlib level 0-9, low values favour speed
+ENCODER_WORKERS = 2  # Threads used to encode snapshots
+
+# Command coalescing
+COMMAND_TOLERANCE = 0.01  # Walk setpoints closer than this to a pending one take its place and keep its future
+
+# Joint state cache
+JOINT_STATE_RATE = 20  # Batched joint sensor reads per second
+JOINT_STATE_MAX_AGE = 0.2  # Seconds before cached angles are considered stale
+HEAD_SETTLE_TIME = 0.3  # Seconds after a head step before the joint sensors, not its target, are where the next starts
+
+# Robot telemetry
+TELEMETRY_RATE = 1.0  # Batched ALMemory reads per second
+TELEMETRY_HISTORY = 600  # Samples kept per value
+
+# Connection handling
+CONNECT_ATTEMPTS = 3  # Attempts made by init_robot before giving up
+RECONNECT_BACKOFF = 0.5  # First retry delay in seconds, doubled after every failure
+RECONNECT_MAX_BACKOFF = 10.0  # Longest delay between connection attempts
+HEARTBEAT_INTERVAL = 1.0  # Seconds between liveness checks
+HEARTBEAT_TIMEOUT = 1.0  # Seconds a heartbeat ping may take before it counts as missed
+HEARTBEAT_MISSES = 2  # Missed heartbeats before the session is considered lost
+COMMAND_REPLAY = True  # Hold commands through a reconnect and replay them, False rejects them
+COMMAND_REPLAY_TIMEOUT = 10.0  # Seconds a command waits for the robot to come back
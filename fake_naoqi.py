@@ -0,0 +1,727 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Fake NAOqi
+Local stand-ins for NAOqi services so the pipeline can be exercised without a robot
+"""
+
+import os
+import time
+import random
+import threading
+from PIL import Image, ImageOps
+import numpy as np
+
+BLOB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blob")
+
+# ALVideoDevice resolution ids and colour spaces understood by FakeVideoDevice
+VIDEO_RESOLUTIONS = {8: (40, 30), 7: (80, 60), 0: (160, 120), 1: (320, 240), 2: (640, 480), 3: (1280, 960)}
+VIDEO_COLOR_SPACES = {9: 2, 11: 3, 13: 3}  # colour space -> layers
+
+
+def _rgb_to_yuv422(rgb):
+    """Pack an HxWx3 RGB frame as HxWx2 YUYV (Y0 U Y1 V)"""
+    rgb = rgb.astype(np.float32)
+    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+    y = 0.299 * r + 0.587 * g + 0.114 * b
+    u = (b - y) * 0.564 + 128.0
+    v = (r - y) * 0.713 + 128.0
+    packed = np.empty(rgb.shape[:2] + (2,), np.float32)
+    packed[:, :, 0] = y
+    # Average each horizontal pixel pair for the shared chroma samples
+    packed[:, 0::2, 1] = (u[:, 0::2] + u[:, 1::2]) / 2.0
+    packed[:, 1::2, 1] = (v[:, 0::2] + v[:, 1::2]) / 2.0
+    return np.clip(packed, 0, 255).astype(np.uint8)
+
+
+def _find_jpegs(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(".jpg"):
+                yield os.path.join(root, name)
+
+
+class FakeVideoDevice:
+    """Stand-in ALVideoDevice that replays JPEGs from blob/ (or synthetic frames)
+
+    Frames advance at the subscribed frame rate, so polling faster than that
+    returns the same frame and timestamp again, like the real device. Each
+    getImageRemote call waits for the injected latency plus the time the
+    payload would take at the given bandwidth (bytes per second). While
+    the FakeRobot it belongs to is in an outage every call fails.
+    """
+
+    def __init__(self, source=BLOB_DIR, latency=0.0, jitter=0.0, bandwidth=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.robot = None  # Set by FakeRobot
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.parameters = {}
+        self.frame_cache = {}
+
+        self.sources = []
+        if source and source != "synthetic":
+            for path in sorted(_find_jpegs(source)):
+                img = Image.open(path)
+                # Let the JPEG decoder scale down; nothing larger than k4VGA is ever served
+                img.draft("RGB", (1280, 960))
+                self.sources.append(img.convert("RGB"))
+
+    def _frames(self, resolution, color_space):
+        """Encoded payloads for every source frame at the given settings, built once"""
+        key = (resolution, color_space)
+        with self.lock:
+            if key not in self.frame_cache:
+                width, height = VIDEO_RESOLUTIONS[resolution]
+                if self.sources:
+                    rgb_frames = [np.asarray(ImageOps.fit(img, (width, height))) for img in self.sources]
+                else:
+                    rgb_frames = [self._synthetic(width, height, i) for i in range(30)]
+                frames = []
+                for rgb in rgb_frames:
+                    if color_space == 13:
+                        rgb = rgb[:, :, ::-1]
+                    elif color_space == 9:
+                        rgb = _rgb_to_yuv422(rgb)
+                    frames.append(np.ascontiguousarray(rgb).tobytes())
+                self.frame_cache[key] = frames
+            return self.frame_cache[key]
+
+    def preload(self, resolution, color_space):
+        """Build the frames for the given settings now rather than on the first subscribe"""
+        self._frames(resolution, color_space)
+
+    def _synthetic(self, width, height, index):
+        """A moving colour gradient"""
+        x = np.linspace(0, 255, width, dtype=np.float32)
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        frame = np.empty((height, width, 3), np.uint8)
+        frame[:, :, 0] = (x + index * 8) % 256
+        frame[:, :, 1] = y
+        frame[:, :, 2] = (x[::-1] + y) / 2
+        return frame
+
+    def _check_link(self):
+        if self.robot is not None and self.robot.is_down():
+            raise RuntimeError("ALVideoDevice: network unreachable")
+
+    def _delay(self, nbytes):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if self.bandwidth:
+            delay += float(nbytes) / self.bandwidth
+        if delay > 0:
+            time.sleep(delay)
+
+    def subscribeCamera(self, name, camera_id, resolution, color_space, fps):
+        self._check_link()
+        if resolution not in VIDEO_RESOLUTIONS or color_space not in VIDEO_COLOR_SPACES:
+            raise RuntimeError(f"ALVideoDevice: unsupported settings {resolution}/{color_space}")
+        with self.lock:
+            handle = name
+            suffix = 0
+            while handle in self.subscribers:
+                suffix += 1
+                handle = f"{name}_{suffix}"
+            self.subscribers[handle] = {
+                "camera": camera_id,
+                "resolution": resolution,
+                "color_space": color_space,
+                "fps": fps,
+                "start": time.time(),
+            }
+        self._frames(resolution, color_space)
+        return handle
+
+    def subscribe(self, name, resolution, color_space, fps):
+        return self.subscribeCamera(name, 0, resolution, color_space, fps)
+
+    def unsubscribe(self, handle):
+        with self.lock:
+            return self.subscribers.pop(handle, None) is not None
+
+    def getSubscribers(self):
+        with self.lock:
+            return list(self.subscribers)
+
+    def setParameter(self, handle, parameter, value):
+        self.parameters[(handle, parameter)] = value
+        return True
+
+    def getParameter(self, handle, parameter):
+        return self.parameters.get((handle, parameter), 0)
+
+    def setResolution(self, handle, resolution):
+        self.subscribers[handle]["resolution"] = resolution
+        self._frames(resolution, self.subscribers[handle]["color_space"])
+        return True
+
+    def setColorSpace(self, handle, color_space):
+        self.subscribers[handle]["color_space"] = color_space
+        self._frames(self.subscribers[handle]["resolution"], color_space)
+        return True
+
+    def setFrameRate(self, handle, fps):
+        self.subscribers[handle]["fps"] = fps
+        return True
+
+    def getImageRemote(self, handle):
+        self._check_link()
+        with self.lock:
+            sub = self.subscribers.get(handle)
+            if sub is None:
+                return None
+            sub = dict(sub)
+        frames = self._frames(sub["resolution"], sub["color_space"])
+
+        # The newest frame the camera has produced at the subscribed rate
+        index = int((time.time() - sub["start"]) * sub["fps"])
+        timestamp = sub["start"] + float(index) / sub["fps"]
+        payload = frames[index % len(frames)]
+
+        self._delay(len(payload))
+        # The link may have gone down while the frame was on its way
+        self._check_link()
+        width, height = VIDEO_RESOLUTIONS[sub["resolution"]]
+        return [
+            width, height, VIDEO_COLOR_SPACES[sub["color_space"]], sub["color_space"],
+            int(timestamp), int((timestamp - int(timestamp)) * 1e6),
+            payload, sub["camera"],
+        ]
+
+    def releaseImage(self, handle):
+        return True
+
+
+# Joint names per chain, as reported by ALMotion.getBodyNames
+CHAINS = {
+    "Head": ["HeadYaw", "HeadPitch"],
+    "LArm": ["LShoulderPitch", "LShoulderRoll", "LElbowYaw", "LElbowRoll", "LWristYaw", "LHand"],
+    "LLeg": ["LHipYawPitch", "LHipRoll", "LHipPitch", "LKneePitch", "LAnklePitch", "LAnkleRoll"],
+    "RLeg": ["RHipYawPitch", "RHipRoll", "RHipPitch", "RKneePitch", "RAnklePitch", "RAnkleRoll"],
+    "RArm": ["RShoulderPitch", "RShoulderRoll", "RElbowYaw", "RElbowRoll", "RWristYaw", "RHand"],
+}
+CHAINS["Arms"] = CHAINS["LArm"] + CHAINS["RArm"]
+CHAINS["Legs"] = CHAINS["LLeg"] + CHAINS["RLeg"]
+CHAINS["Body"] = CHAINS["Head"] + CHAINS["LArm"] + CHAINS["LLeg"] + CHAINS["RLeg"] + CHAINS["RArm"]
+CHAINS["Joints"] = CHAINS["Body"]
+CHAINS["JointActuators"] = CHAINS["Body"]
+
+# Approximate joint angles of the standard postures
+_STAND_ARMS = {
+    "LShoulderPitch": 1.4, "LShoulderRoll": 0.3, "LElbowYaw": -1.39, "LElbowRoll": -1.0, "LHand": 0.25,
+    "RShoulderPitch": 1.4, "RShoulderRoll": -0.3, "RElbowYaw": 1.39, "RElbowRoll": 1.0, "RHand": 0.25,
+}
+POSTURES = {
+    "StandZero": {},
+    "Stand": dict(_STAND_ARMS),
+    "StandInit": dict(_STAND_ARMS, **{
+        "LHipPitch": -0.45, "LKneePitch": 0.7, "LAnklePitch": -0.35,
+        "RHipPitch": -0.45, "RKneePitch": 0.7, "RAnklePitch": -0.35,
+    }),
+    "Crouch": dict(_STAND_ARMS, **{
+        "LHipPitch": -0.7, "LKneePitch": 2.1, "LAnklePitch": -1.2,
+        "RHipPitch": -0.7, "RKneePitch": 2.1, "RAnklePitch": -1.2,
+    }),
+}
+
+MAX_JOINT_SPEED = 5.0  # rad/s at a speed fraction of 1.0
+
+
+class FakeFuture:
+    """The parts of qi.Future used with _async=True calls; timeouts are in milliseconds"""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._value = None
+        self._error = None
+        self._canceled = False
+        self._callbacks = []
+
+    @classmethod
+    def run(cls, function):
+        """Run function on its own thread and return a future of its result"""
+        future = cls()
+
+        def target():
+            try:
+                future._finish(function(), None)
+            except Exception as e:
+                future._finish(None, str(e))
+
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+        return future
+
+    def _finish(self, value, error):
+        with self._lock:
+            self._value = value
+            self._error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def value(self, timeout=None):
+        if not self._done.wait(None if timeout is None else timeout / 1000.0):
+            raise RuntimeError("Future timeout")
+        if self._error is not None:
+            raise RuntimeError(self._error)
+        return self._value
+
+    def wait(self, timeout=None):
+        return self._done.wait(None if timeout is None else timeout / 1000.0)
+
+    def isFinished(self):
+        return self._done.is_set()
+
+    def isRunning(self):
+        return not self._done.is_set()
+
+    def hasError(self, timeout=None):
+        self.wait(timeout)
+        return self._error is not None
+
+    def hasValue(self, timeout=None):
+        self.wait(timeout)
+        return self._done.is_set() and self._error is None
+
+    def error(self, timeout=None):
+        self.wait(timeout)
+        return self._error
+
+    def cancel(self):
+        self._canceled = True
+
+    def isCancelRequested(self):
+        return self._canceled
+
+    def isCanceled(self):
+        return self._canceled and self._done.is_set()
+
+    def addCallback(self, callback):
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+
+def rpc(method):
+    """Model a remote NAOqi call: network latency, and _async=True returning a future"""
+    def call(self, *args, **kwargs):
+        if kwargs.pop("_async", False):
+            return FakeFuture.run(lambda: call(self, *args, **kwargs))
+        # Half the round trip to reach the robot, half for the reply
+        self.session.delay(0.5)
+        result = method(self, *args, **kwargs)
+        self.session.delay(0.5)
+        return result
+    call.__name__ = method.__name__
+    call.__doc__ = method.__doc__
+    # The undelayed method, for fakes that call each other in-process
+    call.__wrapped__ = method
+    return call
+
+
+class FakeService:
+    def __init__(self, session):
+        self.session = session
+        # Set by the stop methods to interrupt blocking behaviours
+        self.stop_event = threading.Event()
+
+    def _block(self, seconds):
+        """Wait like a blocking behaviour; returns False if it was interrupted"""
+        self.stop_event.clear()
+        return not self.stop_event.wait(seconds)
+
+    @rpc
+    def ping(self):
+        return True
+
+
+class FakeMotion(FakeService):
+    """ALMotion with joint trajectories that move over time"""
+
+    def __init__(self, session):
+        FakeService.__init__(self, session)
+        # The joints belong to the robot, so they survive a reconnect
+        self.robot = session.robot
+        self.lock = self.robot.lock
+        self.trajectories = self.robot.trajectories
+        self.stiffnesses = self.robot.stiffnesses
+
+    def _names(self, names):
+        if isinstance(names, (list, tuple)):
+            expanded = []
+            for name in names:
+                expanded.extend(CHAINS.get(name, [name]))
+            return expanded
+        return list(CHAINS.get(names, [names]))
+
+    def _angle(self, name, now):
+        keys = self.trajectories[name]
+        if now >= keys[-1][0]:
+            return keys[-1][1]
+        return float(np.interp(now, [k[0] for k in keys], [k[1] for k in keys]))
+
+    def _move_to(self, names, targets, durations):
+        now = time.time()
+        with self.lock:
+            for name, target, duration in zip(names, targets, durations):
+                self.trajectories[name] = [(now, self._angle(name, now)), (now + duration, target)]
+
+    def angles(self, names):
+        """Current angles without a simulated round trip"""
+        now = time.time()
+        with self.lock:
+            return [self._angle(name, now) for name in self._names(names)]
+
+    @rpc
+    def getAngles(self, names, useSensors):
+        return self.angles(names)
+
+    @rpc
+    def setAngles(self, names, angles, fractionMaxSpeed):
+        names = self._names(names)
+        if not isinstance(angles, (list, tuple)):
+            angles = [angles] * len(names)
+        now = time.time()
+        speed = MAX_JOINT_SPEED * max(fractionMaxSpeed, 0.01)
+        with self.lock:
+            durations = [abs(a - self._angle(n, now)) / speed for n, a in zip(names, angles)]
+        self._move_to(names, angles, durations)
+
+    @rpc
+    def changeAngles(self, names, changes, fractionMaxSpeed):
+        names = self._names(names)
+        if not isinstance(changes, (list, tuple)):
+            changes = [changes] * len(names)
+        with self.lock:
+            # Relative to where the joints are heading, like NAOqi
+            targets = [self.trajectories[n][-1][1] + c for n, c in zip(names, changes)]
+        speed = MAX_JOINT_SPEED * max(fractionMaxSpeed, 0.01)
+        self._move_to(names, targets, [abs(c) / speed for c in changes])
+
+    @rpc
+    def angleInterpolation(self, names, angleLists, timeLists, isAbsolute):
+        names = self._names(names)
+        if not isinstance(angleLists, (list, tuple)):
+            angleLists = [angleLists]
+        if not isinstance(timeLists, (list, tuple)):
+            timeLists = [timeLists]
+        if len(names) == 1 and not isinstance(angleLists[0], (list, tuple)):
+            angleLists, timeLists = [angleLists], [timeLists]
+        now = time.time()
+        end = now
+        with self.lock:
+            for name, angles, times in zip(names, angleLists, timeLists):
+                if not isinstance(angles, (list, tuple)):
+                    angles, times = [angles], [times]
+                start = self._angle(name, now)
+                if not isAbsolute:
+                    angles = [start + a for a in angles]
+                self.trajectories[name] = [(now, start)] + [(now + t, a) for t, a in zip(times, angles)]
+                end = max(end, now + times[-1])
+        self._block(end - now)
+
+    @rpc
+    def angleInterpolationWithSpeed(self, names, targetAngles, maxSpeedFraction):
+        names = self._names(names)
+        if not isinstance(targetAngles, (list, tuple)):
+            targetAngles = [targetAngles] * len(names)
+        now = time.time()
+        speed = MAX_JOINT_SPEED * max(maxSpeedFraction, 0.01)
+        with self.lock:
+            durations = [abs(a - self._angle(n, now)) / speed for n, a in zip(names, targetAngles)]
+        self._move_to(names, targetAngles, durations)
+        self._block(max(durations or [0.0]))
+
+    @rpc
+    def angleInterpolationBezier(self, names, timeLists, controlPointLists):
+        # Keyframe angles only; the tangent handles do not change the end state
+        angleLists = [[p[0] if isinstance(p, (list, tuple)) else p for p in points] for points in controlPointLists]
+        return FakeMotion.angleInterpolation.__wrapped__(self, names, angleLists, timeLists, True)
+
+    @rpc
+    def setStiffnesses(self, names, stiffnesses):
+        names = self._names(names)
+        if not isinstance(stiffnesses, (list, tuple)):
+            stiffnesses = [stiffnesses] * len(names)
+        with self.lock:
+            for name, value in zip(names, stiffnesses):
+                self.stiffnesses[name] = value
+
+    @rpc
+    def getStiffnesses(self, names):
+        with self.lock:
+            return [self.stiffnesses[name] for name in self._names(names)]
+
+    @rpc
+    def openHand(self, handName):
+        self._move_to([handName], [1.0], [0.5])
+        self._block(0.5)
+
+    @rpc
+    def closeHand(self, handName):
+        self._move_to([handName], [0.0], [0.5])
+        self._block(0.5)
+
+    @rpc
+    def moveToward(self, x, y, theta):
+        self.robot.velocity = (x, y, theta)
+
+    @rpc
+    def move(self, x, y, theta):
+        self.robot.velocity = (x, y, theta)
+
+    @rpc
+    def moveIsActive(self):
+        return self.robot.velocity != (0.0, 0.0, 0.0)
+
+    @rpc
+    def stopMove(self):
+        self.robot.velocity = (0.0, 0.0, 0.0)
+        self.stop_event.set()
+
+    @rpc
+    def killAll(self):
+        self.robot.velocity = (0.0, 0.0, 0.0)
+        self.stop_event.set()
+
+    @rpc
+    def wakeUp(self):
+        FakeMotion.setStiffnesses.__wrapped__(self, "Body", 1.0)
+
+    @rpc
+    def rest(self):
+        FakeMotion.setStiffnesses.__wrapped__(self, "Body", 0.0)
+
+    @rpc
+    def getBodyNames(self, name):
+        return self._names(name)
+
+    @rpc
+    def getTime(self, timeOffset):
+        return self.session.robot_time() + timeOffset
+
+
+class FakePosture(FakeService):
+    """ALRobotPosture that drives FakeMotion towards the standard postures"""
+
+    def __init__(self, session, motion):
+        FakeService.__init__(self, session)
+        self.motion = motion
+
+    @rpc
+    def getPostureList(self):
+        return sorted(POSTURES)
+
+    @rpc
+    def getPosture(self):
+        return self.session.robot.posture
+
+    @rpc
+    def goToPosture(self, postureName, maxSpeedFraction):
+        if postureName not in POSTURES:
+            return False
+        targets = POSTURES[postureName]
+        names = CHAINS["Body"]
+        duration = 2.0 / max(maxSpeedFraction, 0.05)
+        self.motion._move_to(names, [targets.get(n, 0.0) for n in names], [duration] * len(names))
+        if not self._block(duration):
+            return False
+        self.session.robot.posture = postureName
+        return True
+
+    @rpc
+    def applyPosture(self, postureName, maxSpeedFraction):
+        return FakePosture.goToPosture.__wrapped__(self, postureName, maxSpeedFraction)
+
+    @rpc
+    def stopMove(self):
+        self.stop_event.set()
+
+
+class FakeTextToSpeech(FakeService):
+    """ALTextToSpeech that takes about as long as speaking the text would"""
+
+    SECONDS_PER_CHARACTER = 0.06
+
+    def __init__(self, session):
+        FakeService.__init__(self, session)
+        self.spoken = session.robot.spoken
+
+    @rpc
+    def say(self, stringToSay):
+        self.spoken.append(stringToSay)
+        self._block(len(stringToSay) * self.SECONDS_PER_CHARACTER)
+
+    @rpc
+    def stopAll(self):
+        self.stop_event.set()
+
+    @rpc
+    def setVolume(self, volume):
+        self.session.robot.volume = volume
+
+    @rpc
+    def getVolume(self):
+        return self.session.robot.volume
+
+
+class FakeMemory(FakeService):
+    """ALMemory holding inserted values, with device keys read live from the fakes"""
+
+    def __init__(self, session, motion):
+        FakeService.__init__(self, session)
+        self.lock = threading.Lock()
+        self.data = session.robot.memory
+        self.start_time = session.robot.start_time
+        # key -> callable returning the current value
+        self.devices = {
+            "Device/SubDeviceList/Battery/Charge/Sensor/Value": self._battery,
+            "Device/SubDeviceList/Head/Temperature/Sensor/Value": lambda: 52.0 + random.uniform(-0.5, 0.5),
+        }
+        for name in CHAINS["Body"]:
+            device = f"Device/SubDeviceList/{name}"
+            self.devices[device + "/Position/Sensor/Value"] = lambda name=name: motion.angles([name])[0]
+            self.devices[device + "/Hardness/Actuator/Value"] = lambda name=name: motion.stiffnesses[name]
+            # Stiff joints warm up while they hold a position
+            self.devices[device + "/Temperature/Sensor/Value"] = lambda name=name: round(30.0 + 15.0 * motion.stiffnesses[name])
+
+    def _battery(self):
+        # Drains by one percent every two minutes
+        return max(0.0, 0.9 - (time.time() - self.start_time) / 12000.0)
+
+    def _get(self, key):
+        if key in self.devices:
+            return self.devices[key]()
+        with self.lock:
+            if key in self.data:
+                return self.data[key]
+        raise RuntimeError(f"ALMemory::getData: key '{key}' not found")
+
+    @rpc
+    def getData(self, key):
+        return self._get(key)
+
+    @rpc
+    def getListData(self, keys):
+        return [self._get(key) for key in keys]
+
+    @rpc
+    def insertData(self, key, value):
+        with self.lock:
+            self.data[key] = value
+
+    @rpc
+    def getDataListName(self):
+        with self.lock:
+            return sorted(self.devices) + sorted(self.data)
+
+
+class FakeRobot:
+    """What a simulated robot keeps between sessions: its joints, posture,
+    memory, battery, clock, camera and the state of the network link
+
+    Share one between the sessions a session_factory creates, so a
+    reconnect finds the robot as it was left and an outage started with
+    drop() outlasts the session it was started on.
+    """
+
+    def __init__(self, clock_offset=0.0, video=None):
+        self.clock_offset = clock_offset
+        self.down_until = 0.0  # Simulated network outage, see drop()
+        self.video = video if video is not None else FakeVideoDevice()
+        self.video.robot = self
+
+        self.lock = threading.Lock()
+        now = time.time()
+        # joint -> [(time, angle), ...] keyframes, interpolated linearly
+        self.trajectories = dict((name, [(now, 0.0)]) for name in CHAINS["Body"])
+        self.stiffnesses = dict((name, 0.0) for name in CHAINS["Body"])
+        self.velocity = (0.0, 0.0, 0.0)
+        self.posture = "Unknown"
+        self.spoken = []
+        self.volume = 1.0
+        self.memory = {"robotHasFallen": 0}
+        self.start_time = now  # The battery drains from here
+
+    def drop(self, seconds):
+        """Start a network outage: calls fail and connects are refused for seconds"""
+        self.down_until = time.time() + seconds
+
+    def is_down(self):
+        return time.time() < self.down_until
+
+    def time(self):
+        return time.time() + self.clock_offset
+
+
+class FakeSession:
+    """In-process stand-in for qi.Session with simulated ALMotion, ALRobotPosture,
+    ALTextToSpeech, ALMemory and ALVideoDevice
+
+    Every call waits latency plus up to jitter seconds. The robot clock runs
+    clock_offset seconds ahead of the local one. Without a shared robot
+    each session simulates a robot of its own.
+    """
+
+    def __init__(self, latency=0.01, jitter=0.005, clock_offset=0.0, video=None, robot=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.robot = robot if robot is not None else FakeRobot(clock_offset, video)
+        self.url = None
+        self.connected = False
+
+        self.motion = FakeMotion(self)
+        self.services = {
+            "ALMotion": self.motion,
+            "ALRobotPosture": FakePosture(self, self.motion),
+            "ALTextToSpeech": FakeTextToSpeech(self),
+            "ALMemory": FakeMemory(self, self.motion),
+            "ALVideoDevice": self.robot.video,
+        }
+
+    def delay(self, fraction=1.0):
+        """Sleep for one simulated round trip, or the given fraction of one"""
+        if not self.connected:
+            raise RuntimeError("Session not connected")
+        if self.robot.is_down():
+            self.connected = False
+            raise RuntimeError("Network unreachable")
+        delay = (self.latency + random.uniform(0, self.jitter)) * fraction
+        if delay > 0:
+            time.sleep(delay)
+
+    def robot_time(self):
+        return self.robot.time()
+
+    def connect(self, url):
+        if self.robot.is_down():
+            raise RuntimeError(f"Could not connect to {url}: network unreachable")
+        self.url = url
+        self.connected = True
+        self.delay()
+
+    def drop(self, seconds):
+        """Simulate a network outage: calls fail and connects are refused for seconds"""
+        self.robot.drop(seconds)
+        self.connected = False
+
+    def isConnected(self):
+        return self.connected
+
+    def close(self):
+        self.connected = False
+
+    def service(self, name):
+        if not self.connected:
+            raise RuntimeError("Session not connected")
+        self.delay()
+        if name not in self.services:
+            raise RuntimeError(f"Cannot find service '{name}' in index")
+        return self.services[name]
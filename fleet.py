@@ -0,0 +1,167 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Fleet
+Drives several robots from one process: broadcast or targeted commands with
+bounded concurrency and per-robot latency statistics
+
+    python fleet.py speak "Hello Friends"
+    python fleet.py posture StandInit --speed 0.5 --robots nao1,nao2
+    python fleet.py ping --simulate
+    python fleet.py dance
+"""
+
+import time
+import json
+import argparse
+import collections
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait
+import config
+from robot_environment import NaoEnvironment
+from robot_agent import NaoActions
+from camera_metrics import RollingStat
+from choreography import Choreography, DANCE_FILE
+
+
+class NaoFleet:
+    """A NaoActions per robot, addressed by name
+
+    Commands are NaoActions method names. Each one is sent from the fleet's
+    worker pool, which holds at most max_concurrency robots busy at once,
+    and the returned future finishes when the robot has carried it out.
+    """
+
+    def __init__(self, robots=None, session_factory=None, max_concurrency=None):
+        # robots: (name, ip, port) tuples; session_factory(name) may supply fake sessions
+        self.robots = collections.OrderedDict()
+        for name, ip, port in robots if robots is not None else config.ROBOTS:
+            factory = (lambda name=name: session_factory(name)) if session_factory else None
+            self.robots[name] = NaoActions(NaoEnvironment(ip, port, factory))
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency or config.FLEET_CONCURRENCY)
+        # name -> round trip times and command durations, in seconds
+        self.rtt = dict((name, RollingStat()) for name in self.robots)
+        self.command_time = dict((name, RollingStat()) for name in self.robots)
+
+    def connect(self):
+        """Connect to every robot concurrently; returns {name: connected}"""
+        futures = self._map(list(self.robots), lambda agent: agent.nao.init_robot())
+        return self.wait(futures)
+
+    def close(self):
+        for agent in self.robots.values():
+            agent.stop_camera()
+            agent.nao.close()
+        self.executor.shutdown(wait=False)
+
+    def broadcast(self, command, *args, **kwargs):
+        """Send a command to every connected robot; returns {name: future}"""
+        return self.target(self.connected(), command, *args, **kwargs)
+
+    def target(self, names, command, *args, **kwargs):
+        """Send a command to the named robots; returns {name: future}"""
+        unknown = [name for name in names if name not in self.robots]
+        if unknown:
+            raise KeyError(f"Unknown robots: {', '.join(unknown)}")
+        return self._map(names, lambda agent: getattr(agent, command)(*args, **kwargs), self.command_time)
+
+    def ping(self, names=None):
+        """Measure one NAOqi round trip per robot; returns {name: seconds}"""
+        names = names or self.connected()
+        futures = dict((name, self.executor.submit(self.robots[name].nao.ping)) for name in names)
+        results = self.wait(futures)
+        for name, rtt in results.items():
+            if isinstance(rtt, float):
+                self.rtt[name].add(rtt)
+        return results
+
+    def dance(self, choreography=None, names=None):
+        """Run a choreography in sync on the named or all connected robots; returns its report"""
+        choreography = choreography or Choreography.from_file(DANCE_FILE)
+        names = names or self.connected()
+        return choreography.run(dict((name, self.robots[name].nao.services["motion"]) for name in names))
+
+    def connected(self):
+        return [name for name, agent in self.robots.items() if agent.is_connected()]
+
+    def wait(self, futures, timeout=None):
+        """Wait for {name: future}; returns {name: result}, with exceptions in place of failed results"""
+        wait(list(futures.values()), timeout)
+        results = {}
+        for name, future in futures.items():
+            if not future.done():
+                results[name] = TimeoutError(f"{name} did not finish in time")
+            elif future.exception() is not None:
+                results[name] = future.exception()
+            else:
+                results[name] = future.result()
+        return results
+
+    def latency_report(self):
+        """Per-robot round trip and command duration percentiles, in milliseconds"""
+        return dict(
+            (name, {"rtt": self.rtt[name].summary(), "command": self.command_time[name].summary()})
+            for name in self.robots
+        )
+
+    def _map(self, names, call, stat=None):
+        return dict((name, self.executor.submit(self._run, name, call, stat)) for name in names)
+
+    def _run(self, name, call, stat):
+        ### Runs on the fleet pool; waits for the robot so the pool bounds concurrency
+        start = time.time()
+        result = call(self.robots[name])
+        if hasattr(result, "result") and callable(result.result):
+            result = result.result()
+        if stat is not None:
+            stat[name].add(time.time() - start)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send a command to several robots at once")
+    parser.add_argument("command", choices=["speak", "posture", "ping", "dance"])
+    parser.add_argument("values", nargs="*", help="text to say, or posture name")
+    parser.add_argument("--speed", type=float, default=0.5, help="posture speed")
+    parser.add_argument("--robots", help="comma separated robot names from config.ROBOTS, default all")
+    parser.add_argument("--simulate", action="store_true", help="use fake sessions instead of robots")
+    args = parser.parse_args()
+    if args.command in ("speak", "posture") and not args.values:
+        parser.error(f"{args.command} needs " + ("the text to say" if args.command == "speak" else "a posture name"))
+
+    robots = config.ROBOTS
+    if args.robots:
+        wanted = args.robots.split(",")
+        robots = [robot for robot in robots if robot[0] in wanted]
+
+    session_factory = None
+    if args.simulate or config.SIMULATE:
+        from fake_naoqi import FakeSession, FakeRobot, FakeVideoDevice
+        # One simulated robot per name, kept across reconnects
+        fake_robots = dict((name, FakeRobot(video=FakeVideoDevice(source="synthetic"))) for name, _, _ in robots)
+        session_factory = lambda name: FakeSession(config.SIMULATED_LATENCY, config.SIMULATED_JITTER, robot=fake_robots[name])
+
+    fleet = NaoFleet(robots, session_factory)
+    try:
+        connected = fleet.connect()
+        print(f"Connected: {', '.join(name for name, ok in connected.items() if ok is True) or 'none'}")
+
+        if args.command == "ping":
+            results = fleet.ping()
+        elif args.command == "dance":
+            fleet.wait(fleet.broadcast("change_posture", "StandInit", 0.8))
+            results = {"report": json.dumps(fleet.dance(), indent=2, sort_keys=True)}
+        elif args.command == "speak":
+            results = fleet.wait(fleet.broadcast("speak", " ".join(args.values)))
+        else:
+            results = fleet.wait(fleet.broadcast("change_posture", args.values[0], args.speed))
+
+        for name, result in results.items():
+            print(f"{name}: {result}")
+        fleet.ping()
+        print(json.dumps(fleet.latency_report(), indent=2, sort_keys=True))
+    finally:
+        fleet.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
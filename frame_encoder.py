@@ -0,0 +1,59 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Frame Encoder
+Encodes camera frames on a worker pool so snapshots never block the caller
+"""
+
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+import PIL.Image
+import config
+
+FORMATS = ("jpeg", "png", "raw")
+
+
+def encode_frame(frame, fmt="jpeg", quality=None, subsampling=None):
+    """Encode an HxWx3 RGB frame as JPEG, PNG or raw bytes"""
+    if fmt == "raw":
+        return frame.tobytes()
+
+    img = PIL.Image.fromarray(frame)
+    b = BytesIO()
+    if fmt == "jpeg":
+        img.save(
+            b, 'JPEG',
+            quality=config.SNAPSHOT_QUALITY if quality is None else quality,
+            subsampling=config.SNAPSHOT_SUBSAMPLING if subsampling is None else subsampling
+        )
+    elif fmt == "png":
+        img.save(b, 'PNG', compress_level=config.SNAPSHOT_PNG_COMPRESSION)
+    else:
+        raise ValueError(f"Unsupported snapshot format: {fmt}")
+    return b.getvalue()
+
+
+class FrameEncoder:
+    def __init__(self, workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or config.ENCODER_WORKERS)
+
+    def submit(self, frame, fmt=None, quality=None, subsampling=None):
+        """Encode a frame on the pool and return a future of the encoded bytes
+
+        frame may also be a callable returning the frame, so that fetching it
+        happens on the worker as well. A None frame resolves to None.
+        """
+        fmt = (fmt or config.SNAPSHOT_FORMAT).lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported snapshot format: {fmt}")
+        return self.executor.submit(self._encode, frame, fmt, quality, subsampling)
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool"""
+        self.executor.shutdown(wait=wait)
+
+    def _encode(self, frame, fmt, quality, subsampling):
+        if callable(frame):
+            frame = frame()
+        if frame is None:
+            return None
+        return encode_frame(frame, fmt, quality, subsampling)
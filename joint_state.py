@@ -0,0 +1,114 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Joint State
+Background cache of joint angles so control code never waits on a getAngles
+round trip
+"""
+
+import time
+import threading
+import config
+
+# ALMemory key of a joint's position sensor
+JOINT_SENSOR_KEY = "Device/SubDeviceList/{}/Position/Sensor/Value"
+
+HEAD_JOINTS = ["HeadYaw", "HeadPitch"]
+BODY_JOINTS = HEAD_JOINTS + [
+    "LShoulderPitch", "LShoulderRoll", "LElbowYaw", "LElbowRoll", "LWristYaw", "LHand",
+    "LHipYawPitch", "LHipRoll", "LHipPitch", "LKneePitch", "LAnklePitch", "LAnkleRoll",
+    "RHipYawPitch", "RHipRoll", "RHipPitch", "RKneePitch", "RAnklePitch", "RAnkleRoll",
+    "RShoulderPitch", "RShoulderRoll", "RElbowYaw", "RElbowRoll", "RWristYaw", "RHand",
+]
+
+
+class JointStateCache:
+    """Polls joint sensors at a fixed rate with one batched call per period
+
+    The angles come from a single ALMemory getListData over the joints'
+    sensor keys, or from motion.getAngles(joints, True) where ALMemory is
+    not available. Sensor values are not raised as ALMemory events, so
+    batched polling is used rather than a subscriber.
+    """
+
+    def __init__(self, nao_env, joints=None, rate=None):
+        self.nao = nao_env
+        self.joints = list(joints or HEAD_JOINTS)
+        self.rate = rate or config.JOINT_STATE_RATE
+        self.lock = threading.Lock()
+        self.angles = {}
+        self.updated = None  # Local time of the last successful read
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._poll_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def get_angles(self, names, max_age=None):
+        """Cached angles for names, or None if any is missing or older than max_age"""
+        with self.lock:
+            if self.updated is None:
+                return None
+            if max_age is not None and time.time() - self.updated > max_age:
+                return None
+            try:
+                return [self.angles[name] for name in names]
+            except KeyError:
+                return None
+
+    def age(self):
+        """Seconds since the last successful read, or None before the first"""
+        with self.lock:
+            return None if self.updated is None else time.time() - self.updated
+
+    def _reader(self):
+        ### Pick the batched read to use, ALMemory first
+        keys = [JOINT_SENSOR_KEY.format(name) for name in self.joints]
+        try:
+            memory = self.nao.get_service("ALMemory")
+            memory.getListData(keys)
+            return lambda: memory.getListData(keys)
+        except Exception as e:
+            if not self.nao.session_manager.is_alive():
+                raise e  # The link is down, not the sensors; ALMemory is tried again next time
+            print(f"ALMemory joint sensors unavailable ({e}), polling ALMotion")
+        motion = self.nao.services["motion"]
+        return lambda: motion.getAngles(self.joints, True)
+
+    def _poll_loop(self):
+        interval = 1.0 / self.rate
+        read = None
+        failures = 0  # Consecutive failed reads, reported once per streak
+        while self.running:
+            start = time.time()
+            if not self.nao.is_connected():
+                # Nothing to read until the session manager reconnects
+                read = None
+                time.sleep(interval)
+                continue
+            try:
+                if read is None:
+                    read = self._reader()
+                values = read()
+                with self.lock:
+                    self.angles.update(zip(self.joints, values))
+                    self.updated = time.time()
+                if failures:
+                    print(f"Joint state reads resumed after {failures} failures")
+                    failures = 0
+            except Exception as e:
+                if not failures:
+                    print(f"Error reading joint state: {e}")
+                failures += 1
+                read = None  # The proxy may belong to a lost session
+            time.sleep(max(0.005, interval - (time.time() - start)))
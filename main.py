@@ -1,5 +1,8 @@
 # -*- coding: future_fstrings -*-
-import qi
+try:
+    import qi
+except ImportError:  # No NAOqi SDK: only the simulated session is available
+    qi = None
 import config
 from robot_agent import NaoActions
 from robot_environment import NaoEnvironment
@@ -8,13 +11,24 @@ from robot_gui import NaoControlGUI
 
 if __name__ == "__main__":
     print(f"Robot IP: {config.IP}, Port: {config.PORT}")
-    nao_brain = NaoEnvironment(config.IP, config.PORT)
+    session_factory = None
+    if config.SIMULATE:
+        from fake_naoqi import FakeSession, FakeRobot
+        print("Simulation mode: using fake NAOqi services")
+        robot = FakeRobot()  # Outlives each session, so a reconnect finds the same robot
+        session_factory = lambda: FakeSession(config.SIMULATED_LATENCY, config.SIMULATED_JITTER, robot=robot)
+    nao_brain = NaoEnvironment(config.IP, config.PORT, session_factory)
 
     if not nao_brain.init_robot():
         print(exit)
 
     nao_actions = NaoActions(nao_brain)
-    nao_gui = NaoControlGUI(nao_actions)
-    nao_actions.speak("Hello Friends")
-    nao_actions.change_posture("StandInit", 0.5)
-    nao_gui.run()
+    try:
+        nao_gui = NaoControlGUI(nao_actions)
+        # Queued on the command threads, so the GUI and camera start without waiting for them
+        nao_actions.speak("Hello Friends")
+        nao_actions.change_posture("StandInit", 0.5)
+        nao_gui.run()
+    finally:
+        # Release the robot's camera subscriptions instead of leaving them until the session times out
+        nao_actions.close()
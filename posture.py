@@ -1,99 +1,62 @@
 # -*- coding: future_fstrings -*-
-import qi
+"""
+NAO Robot Control - Dance
+Plays a choreography routine on one robot; the whole routine is compiled into
+a single keyframed ALMotion call
+
+    python posture.py
+    python posture.py routines/dance.json --smooth
+"""
+
+try:
+    import qi
+except ImportError:  # No NAOqi SDK: only the simulated session is available
+    qi = None
 import config
 import time 
+import argparse
+from choreography import Choreography, DANCE_FILE
 
-STIFFNESS = 0.6
-TIME = 1.5
 
-session = qi.Session()
-url = f"tcp://{config.IP}:{config.PORT}"
-print(f"Attempting to connect to: {url}")
-session.connect(url)
-posture = session.service("ALRobotPosture")
-motion = session.service("ALMotion")
-tts = session.service("ALTextToSpeech")
+def main():
+    parser = argparse.ArgumentParser(description="Play a choreography routine on the robot")
+    parser.add_argument("routine", nargs="?", default=DANCE_FILE, help="JSON (or YAML) routine file")
+    parser.add_argument("--smooth", action="store_true", help="ease between poses with Bezier keyframes")
+    parser.add_argument("--per-move", action="store_true", help="send each move as its own call")
+    args = parser.parse_args()
 
-posture.goToPosture("StandInit", 0.8)
-time.sleep(1)
+    if config.SIMULATE:
+        from fake_naoqi import FakeSession
+        session = FakeSession(config.SIMULATED_LATENCY, config.SIMULATED_JITTER)
+    elif qi is None:
+        parser.error("the NAOqi SDK (qi) is not installed; set SIMULATE in config.py to run offline")
+    else:
+        session = qi.Session()
+    url = f"tcp://{config.IP}:{config.PORT}"
+    print(f"Attempting to connect to: {url}")
+    session.connect(url)
+    posture = session.service("ALRobotPosture")
+    motion = session.service("ALMotion")
+    tts = session.service("ALTextToSpeech")
 
+    posture.goToPosture("StandInit", 0.8)
+    time.sleep(1)
 
-motion.setStiffnesses("Arms", STIFFNESS)
+    dance = Choreography.from_file(args.routine, compiled=not args.per_move, smooth=args.smooth)
 
-tts.say("Watch my dance moves")
+    tts.say("Watch my dance moves")
 
-left_arm_joints = ["LShoulderPitch", "LShoulderRoll", "LElbowYaw", "LElbowRoll", "LWristYaw"]
-right_arm_joints = ["RShoulderPitch", "RShoulderRoll", "RElbowYaw", "RElbowRoll", "RWristYaw"]
+    print(f"Dancing: {', '.join(move['name'] for move in dance.moves)} ({dance.duration():.1f} s)")
+    report = dance.run({"nao": motion})
+    print(f"Started within {report['robots']['nao']['start_error'].get('max_ms')} ms of schedule")
+    for error in report["robots"]["nao"]["errors"]:
+        print(f"ERROR: {error}")
 
-print("Move 1: Extending arms...")
-motion.angleInterpolation(
-    left_arm_joints + right_arm_joints,
-    [0.0, 0.5, 0.0, -0.1, 0.0] + [0.0, -0.5, 0.0, 0.1, 0.0],
-    [TIME, TIME, TIME, TIME, TIME] + [TIME, TIME, TIME, TIME, TIME],
-    True
-)
+    print("Returning to initial position...")
+    posture.goToPosture("StandInit", 0.8)
 
-print("Move 2: Crossing arms...")
-motion.angleInterpolation(
-    left_arm_joints + right_arm_joints,
-    [1.0, -0.3, 0.0, -1.5, 0.0] + [1.0, 0.3, 0.0, 1.5, 0.0],
-    [TIME, TIME, TIME, TIME, TIME] + [TIME, TIME, TIME, TIME, TIME],
-    True
-)
+    print("Performance complete!")
 
-print("Move 3: Y-shape pose...")
-motion.angleInterpolation(
-    left_arm_joints + right_arm_joints,
-    [-0.5, 1.2, -0.5, -0.3, 0.0] + [-0.5, -1.2, 0.5, 0.3, 0.0],
-    [TIME, TIME, TIME, TIME, TIME] + [TIME, TIME, TIME, TIME, TIME],
-    True
-)
 
-print("Move 4: Wave motion...")
-motion.angleInterpolation(
-    left_arm_joints[0:2] + right_arm_joints[0:2],
-    [-1.0, 0.3] + [1.0, -0.3],
-    [TIME, TIME] + [TIME, TIME],
-    True
-)
-motion.angleInterpolation(
-    left_arm_joints[0:2] + right_arm_joints[0:2],
-    [1.0, -0.3] + [-1.0, 0.3],
-    [TIME, TIME] + [TIME, TIME],
-    True
-)
-motion.angleInterpolation(
-    left_arm_joints[0:2] + right_arm_joints[0:2],
-    [-1.0, 0.3] + [1.0, -0.3],
-    [TIME, TIME] + [TIME, TIME],
-    True
-)
-
-print("Move 5: Hand movements...")
-# Open both hands
-motion.openHand('LHand')
-motion.openHand('RHand')
-time.sleep(0.5)
-
-motion.angleInterpolation(
-    left_arm_joints + right_arm_joints,
-    [0.2, 0.8, -1.5, -0.5, 0.0] + [0.2, -0.8, 1.5, 0.5, 0.0],
-    [TIME, TIME, TIME, TIME, TIME] + [TIME, TIME, TIME, TIME, TIME],
-    True
-)
-
-motion.closeHand('LHand')
-motion.closeHand('RHand')
-
-print("Final pose...")
-motion.angleInterpolation(
-    left_arm_joints + right_arm_joints,
-    [0.4, 0.4, 0.0, -0.6, 0.0] + [0.4, -0.4, 0.0, 0.6, 0.0],
-    [TIME, TIME, TIME, TIME, TIME] + [TIME, TIME, TIME, TIME, TIME],
-    True
-)
-
-print("Returning to initial position...")
-posture.goToPosture("StandInit", 0.8)
-
-print("Performance complete!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Resize Engines
+Interchangeable backends that downscale camera frames for the preview
+"""
+
+from PIL import Image
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None  # The "opencv" engine is only available with OpenCV installed
+
+
+class ResizeEngine:
+    """Base class: resizes HxWxC uint8 frames to a fixed size into reusable buffers"""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._output = None
+
+    def resize(self, frame, out=None):
+        """Resize frame into out, or into the engine's own buffer
+
+        Frames already at the target size are returned as they are. The
+        engine's own buffer is only valid until the next call.
+        """
+        src_height, src_width, layers = frame.shape
+        if (src_width, src_height) == (self.width, self.height):
+            return frame
+
+        shape = (self.height, self.width, layers)
+        if out is None:
+            if self._output is None or self._output.shape != shape:
+                self._output = np.empty(shape, np.uint8)
+            out = self._output
+        self._resize_into(frame, out)
+        return out
+
+    def _resize_into(self, frame, out):
+        raise NotImplementedError
+
+    def _integer_factors(self, frame):
+        """Return the (x, y) downscale factors if both are whole numbers, else None"""
+        src_height, src_width = frame.shape[:2]
+        if src_width % self.width or src_height % self.height:
+            return None
+        return src_width // self.width, src_height // self.height
+
+
+class PillowResizer(ResizeEngine):
+    """Generic Pillow resize, BOX when shrinking and BILINEAR when enlarging"""
+
+    def _resize_into(self, frame, out):
+        shrinking = frame.shape[1] >= self.width and frame.shape[0] >= self.height
+        pil_filter = Image.BOX if shrinking else Image.BILINEAR
+        pil_image = Image.fromarray(frame).resize((self.width, self.height), pil_filter)
+        np.copyto(out, np.asarray(pil_image))
+
+
+class BoxResizer(PillowResizer):
+    """Exact area averaging through NumPy strided views for integer ratios"""
+
+    def __init__(self, width, height):
+        PillowResizer.__init__(self, width, height)
+        self._accumulator = None
+
+    def _resize_into(self, frame, out):
+        factors = self._integer_factors(frame)
+        if factors is None:
+            # Non-integer ratio, let Pillow handle it
+            PillowResizer._resize_into(self, frame, out)
+            return
+
+        factor_x, factor_y = factors
+        samples = factor_x * factor_y
+        # uint16 holds up to 256 samples plus the rounding term: 256 * 255 + 128 = 65408
+        dtype = np.uint16 if samples <= 256 else np.uint32
+        if self._accumulator is None or self._accumulator.shape != out.shape or self._accumulator.dtype != dtype:
+            self._accumulator = np.empty(out.shape, dtype)
+
+        # Sum one strided view per position inside the factor_y x factor_x block
+        accumulator = self._accumulator
+        accumulator.fill(samples // 2)
+        for dy in range(factor_y):
+            for dx in range(factor_x):
+                np.add(accumulator, frame[dy::factor_y, dx::factor_x], out=accumulator)
+        if samples & (samples - 1) == 0:
+            np.right_shift(accumulator, samples.bit_length() - 1, out=accumulator)
+        else:
+            np.floor_divide(accumulator, samples, out=accumulator)
+        np.copyto(out, accumulator, casting='unsafe')
+
+
+class PillowReduceResizer(PillowResizer):
+    """Pillow's Image.reduce for integer ratios (Pillow 7+), BOX resize otherwise"""
+
+    def _resize_into(self, frame, out):
+        factors = self._integer_factors(frame)
+        if factors is None or not hasattr(Image.Image, "reduce"):
+            PillowResizer._resize_into(self, frame, out)
+            return
+        np.copyto(out, np.asarray(Image.fromarray(frame).reduce(factors)))
+
+
+class OpenCVResizer(ResizeEngine):
+    """cv2.resize with INTER_AREA, written straight into the output buffer"""
+
+    def __init__(self, width, height):
+        if cv2 is None:
+            raise ImportError("OpenCV is not installed")
+        ResizeEngine.__init__(self, width, height)
+
+    def _resize_into(self, frame, out):
+        cv2.resize(frame, (self.width, self.height), dst=out, interpolation=cv2.INTER_AREA)
+
+
+RESIZE_ENGINES = {
+    "box": BoxResizer,
+    "reduce": PillowReduceResizer,
+    "opencv": OpenCVResizer,
+    "pillow": PillowResizer,
+}
+
+
+def default_engine():
+    """The fastest engine available: "opencv" with OpenCV installed, otherwise "reduce" (Pillow)"""
+    return "opencv" if cv2 is not None else "reduce"
+
+
+def create_resizer(name, width, height):
+    """Build the named resize engine; "auto", or an unavailable engine, gets default_engine()"""
+    if name == "auto":
+        name = default_engine()
+    try:
+        return RESIZE_ENGINES[name](width, height)
+    except (KeyError, ImportError) as e:
+        fallback = default_engine()
+        print(f"Resize engine '{name}' unavailable ({e}), using '{fallback}'")
+        return RESIZE_ENGINES[fallback](width, height)
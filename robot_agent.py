@@ -3,33 +3,85 @@
 # File responsible for either accepting inputs or acting as the medium of inputs, all sent to robot_environment
 from robot_environment import NaoEnvironment
 from camera_controller import CameraController
+from frame_encoder import FrameEncoder
+from command_coalescer import CommandCoalescer
+import config
+
+
+def _add_head_steps(pending, step):
+    """Fold two (yaw step, pitch step, center) head commands into one, None if they must both be sent"""
+    if step[2]:
+        return step  # Centering is absolute, it replaces the steps before it
+    if pending[2]:
+        return None  # The step starts from the centred head, send it after the centring
+    return (pending[0] + step[0], pending[1] + step[1], False)
+
 
 class NaoActions:
     def __init__(self, nao_env_obj):
         self.nao = nao_env_obj
         self.camera_controller = CameraController(self)
         self.current_camera_id = 0
+        self.encoder = FrameEncoder()
+        # Only the newest walk/head/posture setpoint is sent; repeats are skipped
+        self.coalescer = CommandCoalescer(config.COMMAND_TOLERANCE)
+        self.coalescer.add_channel("walk", lambda v: self.nao.motion_endpoint(*v))
+        # Head commands are relative steps: none may be dropped, queued ones are added up
+        self.coalescer.add_channel("head", lambda v: self.nao.head_endpoint(*v), merge=_add_head_steps)
+        self.coalescer.add_channel("posture", lambda v: self.nao.posture_endpoint(*v), idempotent=False)
+        # The robot forgot its setpoints with the old session, so resend the next ones
+        self.nao.reconnect_callbacks.append(self.coalescer.clear)
+
+    # Robot commands return futures and never wait for the robot
 
     def speak(self, message):
-        self.nao.tts_endpoint(message)
+        return self.nao.tts_endpoint(message)
 
     def change_posture(self, new_pos, speed):
-        self.nao.posture_endpoint(new_pos, speed)
+        return self.coalescer.send("posture", (new_pos, speed))
 
     def walk(self, x, y, theta):
-        self.nao.motion_endpoint(x, y, theta)
+        return self.coalescer.send("walk", (x, y, theta))
 
     def movehead(self, head_yaw_speed=0, head_pitch_speed=0, center=False):
         if center:
-            self.nao.head_endpoint(0, 0, center=True)
+            return self.coalescer.send("head", (0, 0, True))
         else:
-            self.nao.head_endpoint(head_yaw_speed, head_pitch_speed)
+            return self.coalescer.send("head", (head_yaw_speed, head_pitch_speed, False))
+
+    def cancel(self, channel=None):
+        # Interrupt speech, postures and walking; all channels by default
+        self.coalescer.clear()
+        self.nao.cancel_commands(channel)
+
+    def subscribe_telemetry(self, callback):
+        # callback(changed_values) runs on the telemetry thread
+        self.nao.telemetry.subscribe(callback)
+
+    def get_telemetry(self):
+        return self.nao.telemetry.summary()
+
+    def is_connected(self):
+        return self.nao.is_connected()
 
-    def start_camera(self, callback):
-        return self.camera_controller.start(callback)
+    def get_command_stats(self):
+        return dict(self.coalescer.counters)
+
+    def start_camera(self, callback, tk_root=None):
+        return self.camera_controller.start(callback, tk_root)
         
     def stop_camera(self):
-        return self.camera_controller.stop()
+        result = self.camera_controller.stop()
+        # Snapshot subscriptions would otherwise stay open on the robot
+        self.nao.release_cameras()
+        return result
+        
+    def close(self):
+        # Stop the camera, drop unsent commands and shut down every background thread and the session
+        self.stop_camera()
+        self.coalescer.clear()
+        self.encoder.shutdown(wait=False)
+        self.nao.close()
         
     def change_camera(self, camera_id):
         # This function is kept for backward compatibility
@@ -39,7 +91,28 @@ class NaoActions:
     def get_camera_fps(self):
         return self.camera_controller.get_current_fps()
 
+    def get_camera_metrics(self):
+        return self.camera_controller.get_metrics()
+
+    def set_detection(self, enabled=True):
+        return self.camera_controller.set_detection(enabled)
+
+    def subscribe_detections(self, callback):
+        # callback(detections) runs on the detection thread, once per processed frame
+        self.camera_controller.subscribe_detections(callback)
+
+    def get_detections(self):
+        return self.camera_controller.get_detections()
+
+    def capture_snapshot(self, camera_id=0, fmt=None, quality=None, subsampling=None):
+        # Returns a future of the encoded image; fetching and encoding run on the encoder pool
+        # Snapshots come from the running stream when possible
+        frame = self.camera_controller.get_latest_frame(camera_id)
+        if frame is None:
+            frame = lambda: self.nao.capture_frame(camera_id)
+        return self.encoder.submit(frame, fmt, quality, subsampling)
+
     # Legacy method - kept for backward compatibility
     def get_camera_image(self, camera_id=0):
-        return self.nao.camera_endpoint(camera_id)
+        return self.capture_snapshot(camera_id, fmt="jpeg").result()
 
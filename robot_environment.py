@@ -1,12 +1,20 @@
 # -*- coding: future_fstrings -*-
 # robot_environment.py 
 # File responsible for taking in various inputs and sending them to the NAO bot
-import qi
+try:
+    import qi
+except ImportError:  # No NAOqi SDK: only the simulated session is available
+    qi = None
 import time
-import PIL.Image
-from io import BytesIO
-import numpy as np
+import threading
 import config
+from camera_controller import decode_image
+from frame_encoder import encode_frame
+from camera_subscriptions import CameraSubscriptionManager
+from command_dispatcher import CommandDispatcher
+from joint_state import JointStateCache, HEAD_JOINTS
+from telemetry import TelemetryReader
+from session_manager import SessionManager
 
 
 
@@ -14,78 +22,171 @@ class ConnectionError(Exception):
     pass
 
 class NaoEnvironment:
-    def __init__(self, ip, port):
+    # services key -> NAOqi service name, re-created after every reconnect
+    SERVICE_NAMES = {
+        "tts": "ALTextToSpeech",
+        "motion": "ALMotion",
+        "posture": "ALRobotPosture",
+        "video": "ALVideoDevice",
+    }
+
+    def __init__(self, ip, port, session_factory=None):
         self.ip = str(ip)
         self.port = str(port)
+        # Creates the session; fake_naoqi.FakeSession runs everything offline
+        if session_factory is None and qi is None:
+            raise ImportError("The NAOqi SDK (qi) is not installed; pass a session_factory such as fake_naoqi.FakeSession")
+        self.session_factory = session_factory or qi.Session
         self.session = None
         self.services = {}
+        self.service_names = dict(self.SERVICE_NAMES)
+        # Connects with backoff, runs the heartbeat and reconnects after a drop
+        self.session_manager = SessionManager(f"tcp://{self.ip}:{self.port}", self.session_factory)
+        self.session_manager.on_connect.append(self._on_connect)
+        self.session_manager.on_disconnect.append(self._on_disconnect)
+        # Called without arguments after a reconnect
+        self.reconnect_callbacks = []
+        self.camera_subscriptions = CameraSubscriptionManager(self)
+        # camera_id -> handle kept subscribed for single-shot captures
+        self.snapshot_handles = {}
+        self.snapshot_lock = threading.Lock()
+        # Endpoints queue their NAOqi calls here and return futures
+        self.dispatcher = CommandDispatcher()
+        # Head angles polled in the background, so head steps need no getAngles call
+        self.joint_state = JointStateCache(self)
+        # [yaw, pitch] the last head command is heading for, None once the head has got there
+        self._head_target = None
+        self._head_sent = 0.0  # Local time of the last head command
+        # Battery, temperatures, stiffness and fall state, one ALMemory read per period
+        self.telemetry = TelemetryReader(self)
         
     def init_robot(self):
-        for attempt in range(3):
-            try:
-                self.session = qi.Session()
-                url = f"tcp://{self.ip}:{self.port}"
-                print(f"Attempting to connect to: {url}")
-
-                self.session.connect(url)
-                print("Successfully connected to the robot!")
-
-                self._init_services()
-
-                return True
-
-            except RuntimeError as e:
-                print(f"ERROR: Connection attempt #{attempt+1} failed: {e}")
-                if attempt < 2:
-                    print("Retrying in 5 seconds...")
-                    time.sleep(5)
-                else:
-                    print("Max connection attempts reached. Unable to connect.")
-                    self.session = None
-                    return False
+        if not self.session_manager.connect(config.CONNECT_ATTEMPTS):
+            print("Max connection attempts reached. Unable to connect.")
+            return False
+
+        self.session_manager.start_heartbeat()
+        self.joint_state.start()
+        self.telemetry.start()
+        return True
+
+    def close(self):
+        ### Stop the background threads and disconnect
+        self.release_cameras()
+        self.telemetry.stop()
+        self.joint_state.stop()
+        self.dispatcher.shutdown(wait=False)
+        self.session_manager.stop()
+
+    def is_connected(self):
+        return self.session_manager.is_connected()
+
+    def ping(self):
+        ### Round trip time of one NAOqi call, in seconds
+        if self.session is None:
+            raise ConnectionError("Not connected to robot")
+        start = time.time()
+        self.session_manager.probe.ping()
+        return time.time() - start
+
+    def _on_connect(self, session):
+        ### (Re)connected: swap in the new session and rebuild every cached proxy
+        reconnect = self.session is not None
+        self.session = session
+        self._head_target = None  # The head may have moved while we were away
+        self._init_services()
+        if reconnect:
+            # Subscriptions belonged to the old session
+            self.camera_subscriptions.forget_all()
+            with self.snapshot_lock:
+                self.snapshot_handles.clear()
+            for callback in self.reconnect_callbacks:
+                callback()
+
+    def _on_disconnect(self):
+        if not config.COMMAND_REPLAY:
+            # Reject queued commands instead of holding them until the robot is back
+            self.dispatcher.cancel(interrupt=False)
     
     def _init_services(self):
         ### Initialize commonly used services after connection
-        self.services["tts"] = self.session.service("ALTextToSpeech")
-        self.services["motion"] = self.session.service("ALMotion")
-        self.services["posture"] = self.session.service("ALRobotPosture")
-        self.services["video"] = self.session.service("ALVideoDevice")
+        ### Proxies resolve concurrently in the background; a call waits only for its own service
+        services = {}
+        for key, name in self.service_names.items():
+            services[key] = self.session_manager.resolve(self.session, name)
+        self.services.update(services)
+
+        ### Cancelling a channel interrupts whatever that service is doing
+        self.dispatcher.set_stop_hook("tts", lambda: self.services["tts"].stopAll())
+        self.dispatcher.set_stop_hook("posture", lambda: self.services["posture"].stopMove())
+        self.dispatcher.set_stop_hook("motion", lambda: self.services["motion"].stopMove())
     
     def get_service(self, service_name):
         ### Get a service, creating it if not already cached
         if service_name not in self.services:
             self.services[service_name] = self.session.service(service_name)
+            self.service_names[service_name] = service_name
         return self.services[service_name]
-    
-    def tts_endpoint(self, message):
-        ### Send text to speech
+
+    def _check_connected(self):
+        ### Commands are rejected straight away unless they can wait for a reconnect
         if self.session is None:
             raise ConnectionError("Not connected to robot")
-        
-        tts = self.services.get("tts")
-        #if tts is None:
-        #    tts = self.get_service("ALTextToSpeech")
-        
-        tts.say(message)
+        if not config.COMMAND_REPLAY and not self.is_connected():
+            raise ConnectionError("Connection to robot lost")
 
+    def _run(self, command, *args):
+        ### Run a command on its dispatcher thread, replaying it once if the link dropped mid-call
+        timeout = config.COMMAND_REPLAY_TIMEOUT if config.COMMAND_REPLAY else 0
+        for attempt in range(2):
+            if not self.session_manager.wait_connected(timeout):
+                raise ConnectionError("Connection to robot lost")
+            try:
+                return command(*args)
+            except RuntimeError:
+                self.session_manager.report_failure()
+                if attempt or not config.COMMAND_REPLAY or self.is_connected():
+                    raise
+
+    def _call(self, service, method, *args):
+        ### Dispatch service.method(*args), looking the proxy up when it runs
+        return self._run(lambda: getattr(self.services[service], method)(*args))
+    
+    def tts_endpoint(self, message):
+        ### Send text to speech, returns a future finishing when NAO is done talking
+        self._check_connected()
+        return self.dispatcher.submit("tts", self._call, "tts", "say", message)
 
-    def motion_endpoint(self, x, y, theta):
-        if self.session is None:
-            raise ConnectionError("Not connected to robot")
 
-        motion = self.services.get("motion")
+    def motion_endpoint(self, x, y, theta):
+        self._check_connected()
         if x != 0.0 or y != 0.0 or theta != 0.0:
-            motion.moveToward(x, y, theta)
+            return self.dispatcher.submit("motion", self._call, "motion", "moveToward", x, y, theta)
         else:
-            motion.stopMove()
+            return self.dispatcher.submit("motion", self._call, "motion", "stopMove")
     
     def head_endpoint(self, head_yaw_speed, head_pitch_speed, center=False):
-        motion = self.services.get("motion")
+        self._check_connected()
+        return self.dispatcher.submit("head", self._run, self._move_head, head_yaw_speed, head_pitch_speed, center)
+
+    def _move_head(self, head_yaw_speed, head_pitch_speed, center):
+        motion = self.services["motion"]
         if center:
             # Center the head with a smoother motion
-            motion.setAngles(["HeadYaw", "HeadPitch"], [0.0, 0.0], 0.2)
+            motion.setAngles(HEAD_JOINTS, [0.0, 0.0], 0.2)
+            self._set_head_target([0.0, 0.0])
         elif head_yaw_speed != 0.0 or head_pitch_speed != 0.0:
-            current_yaw, current_pitch = motion.getAngles(["HeadYaw", "HeadPitch"], True)
+            angles = self.joint_state.get_angles(HEAD_JOINTS, config.JOINT_STATE_MAX_AGE)
+            target = self._head_target
+            if target is not None and self._head_settled():
+                target = None  # The sensors are up to date, and also see moves made by anything else
+            if target is None and angles is None:
+                # No fresh joint state, let NAOqi apply the step relative to the current angles
+                self._head_target = None
+                motion.changeAngles(HEAD_JOINTS, [head_yaw_speed, head_pitch_speed], 0.2)
+                return
+            # While the head is on its way, build on the last target: the sensors lag behind and would undo part of it
+            current_yaw, current_pitch = target if target is not None else angles
             
             # Calculate new positions with direct speed application
             # Back to the original behavior that was working
@@ -97,11 +198,21 @@ class NaoEnvironment:
             new_pitch = max(min(new_pitch, 0.5149), -0.6720)  # Pitch limits from NAO docs
             
             # Set angles with faster movement speed for responsiveness
-            motion.setAngles(["HeadYaw", "HeadPitch"], [new_yaw, new_pitch], 0.2)
+            motion.setAngles(HEAD_JOINTS, [new_yaw, new_pitch], 0.2)
+            self._set_head_target([new_yaw, new_pitch])
+
+    def _set_head_target(self, target):
+        self._head_target = target
+        self._head_sent = time.time()
+
+    def _head_settled(self):
+        ### The cached angles were read after the last head command had time to finish
+        age = self.joint_state.age()
+        return age is not None and time.time() - age > self._head_sent + config.HEAD_SETTLE_TIME
 
     def posture_endpoint(self, name, speed):
         ### http://doc.aldebaran.com/2-1/naoqi/motion/alrobotposture-api.html#ALRobotPostureProxy::getPostureList
-        ### Change Posture of NAO
+        ### Change Posture of NAO, returns a future of goToPosture's result
         ### Methods are the following
         #ALRobotPostureProxy::getPostureList()
         #ALRobotPostureProxy::getPosture()
@@ -112,61 +223,52 @@ class NaoEnvironment:
         #ALRobotPostureProxy::getPostureFamilyList()
         #ALRobotPostureProxy::setMaxTryNumber()
 
-        if self.session is None:
-            raise ConnectionError("Not connected to robot")
-        
-        posture = self.services.get("posture")
-        print(posture)
-        posture.goToPosture(name, speed)
+        self._check_connected()
+        self._head_target = None  # The posture moves the head too
+        return self.dispatcher.submit("posture", self._call, "posture", "goToPosture", name, speed)
 
-    def camera_endpoint(self, camera_id=0):
-        # Get an image from NAO's camera
+    def cancel_commands(self, channel=None):
+        ### Drop queued commands and interrupt running behaviours ("tts", "motion", "head", "posture" or all)
+        return self.dispatcher.cancel(channel)  # Futures of the stop calls, which run in the background
+
+    def capture_frame(self, camera_id=0):
+        # Get a single frame from NAO's camera as an HxWx3 numpy array
         # camera_id: 0 for top camera, 1 for bottom camera
-        # Returns: The image as a PIL Image object
+        # The subscription is kept alive so later snapshots cost one getImageRemote
 
         if self.session is None:
             raise ConnectionError("Not connected to robot")
         video = self.services["video"]
 
-        # Subscribe to camera feed (resolution 2 = 640x480, colorspace 11 = RGB)
-        resolution = config.RESOLUTION
-        colorspace = config.CAMERA_COLOR_SPACE
-        fps = config.CAMERA_COLOR_SPACE
-
-        # Create a unique handle for this client
-        client_name = f"python_client_{int(time.time())}"
-
-        # Subscribe to the camera
-        handle = video.subscribeCamera(client_name, camera_id, resolution, colorspace, fps)
-        try:
-            # Get the image
-            image = video.getImageRemote(handle)
-            if image is None:
-                return None
-            # Image format is [width, height, layers, colorspace, timestamp, binary data]
-            width, height = image[0], image[1]
-            array = image[6]
-            
-            # Convert binary data to PIL Image
-            try:
-                # Create image from binary data
-                img_data = np.frombuffer(array, np.uint8).reshape(height, width, 3)
-                img = PIL.Image.fromarray(img_data)
-                
-                # Convert to jpeg data for Tkinter
-                b = BytesIO()
-                img.save(b, 'jpeg')
-                return b.getvalue()
-                
-            except ImportError:
-                print("PIL or numpy not available, returning raw data")
-                return array
-                
-        finally:
-            # Always unsubscribe 
-            video.unsubscribe(handle)
-
-
+        # Encoder workers can snapshot at the same time, only one of them may subscribe
+        with self.snapshot_lock:
+            handle = self.snapshot_handles.get(camera_id)
+            if handle is None:
+                handle = self.camera_subscriptions.acquire(
+                    camera_id,
+                    config.CAMERA_RESOLUTION,
+                    config.CAMERA_COLOR_SPACE,
+                    config.CAMERA_FPS
+                )
+                self.snapshot_handles[camera_id] = handle
 
+        image = video.getImageRemote(handle)
+        if image is None:
+            return None
+        return decode_image(image)
 
+    def release_cameras(self):
+        ### Drop the subscriptions held for single-shot captures
+        with self.snapshot_lock:
+            for handle in self.snapshot_handles.values():
+                self.camera_subscriptions.release(handle)
+            self.snapshot_handles.clear()
 
+    def camera_endpoint(self, camera_id=0):
+        # Get an image from NAO's camera
+        # camera_id: 0 for top camera, 1 for bottom camera
+        # Returns: The image as JPEG bytes
+        frame = self.capture_frame(camera_id)
+        if frame is None:
+            return None
+        return encode_frame(frame, "jpeg")
@@ -2,8 +2,11 @@
 import Tkinter as tk
 import ttk
 import time
-import math
 from datetime import datetime
+import config
+
+# Overlay colour for each detected shape colour
+DETECTION_COLOURS = {"Yellow": "#ffd600", "Blue": "#3d8bff", "Red": "#ff4d4d"}
 
 class NaoControlGUI:
     def __init__(self, agent):
@@ -274,6 +277,11 @@ class NaoControlGUI:
         fps_label = ttk.Label(header_frame, textvariable=self.fps_display, style="Status.TLabel")
         fps_label.pack(side=tk.RIGHT, padx=10, pady=5)
         
+        # Glass-to-glass latency indicator
+        self.latency_display = tk.StringVar(value="LAT: -- ms")
+        latency_label = ttk.Label(header_frame, textvariable=self.latency_display, style="Status.TLabel")
+        latency_label.pack(side=tk.RIGHT, padx=10, pady=5)
+        
         # Create a frame for the camera canvas with beveled border effect
         camera_border = ttk.Frame(panel, style="ControlPanel.TFrame")
         camera_border.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -296,6 +304,11 @@ class NaoControlGUI:
         # Initialize camera variables
         self.camera_id = 0
         self.camera_img = None
+        self.camera_item = None
+        
+        # Detections arrive on the detection thread and are drawn on the Tk thread
+        self.pending_detections = None
+        self.agent.subscribe_detections(self.on_detections)
     
     def draw_crosshair(self):
         # Calculate canvas dimensions
@@ -339,7 +352,7 @@ class NaoControlGUI:
         
         # Battery status
         ttk.Label(status_frame, text="BATTERY:", style="Dashboard.TLabel").grid(row=1, column=0, sticky='w', padx=5, pady=3)
-        self.battery_status = tk.StringVar(value="75%")
+        self.battery_status = tk.StringVar(value="--%")
         ttk.Label(status_frame, textvariable=self.battery_status, style="Status.TLabel").grid(row=1, column=1, sticky='w', padx=5, pady=3)
         
         # Motor status
@@ -347,11 +360,20 @@ class NaoControlGUI:
         self.motor_status = tk.StringVar(value="ACTIVE")
         ttk.Label(status_frame, textvariable=self.motor_status, style="Status.TLabel").grid(row=2, column=1, sticky='w', padx=5, pady=3)
         
-        # System load
-        ttk.Label(status_frame, text="CPU LOAD:", style="Dashboard.TLabel").grid(row=3, column=0, sticky='w', padx=5, pady=3)
-        self.cpu_status = tk.StringVar(value="32%")
+        # Head CPU temperature
+        ttk.Label(status_frame, text="CPU TEMP:", style="Dashboard.TLabel").grid(row=3, column=0, sticky='w', padx=5, pady=3)
+        self.cpu_status = tk.StringVar(value="--°C")
         ttk.Label(status_frame, textvariable=self.cpu_status, style="Status.TLabel").grid(row=3, column=1, sticky='w', padx=5, pady=3)
         
+        # Hottest joint
+        ttk.Label(status_frame, text="JOINT TEMP:", style="Dashboard.TLabel").grid(row=4, column=0, sticky='w', padx=5, pady=3)
+        self.joint_temp_status = tk.StringVar(value="--°C")
+        ttk.Label(status_frame, textvariable=self.joint_temp_status, style="Status.TLabel").grid(row=4, column=1, sticky='w', padx=5, pady=3)
+        
+        # Telemetry arrives on the reader thread; the flag hands it over to the Tk thread
+        self.telemetry_changed = True
+        self.agent.subscribe_telemetry(self.on_telemetry)
+        
         # Add operation log panel
         log_panel = ttk.Frame(parent, style="ControlPanel.TFrame")
         log_panel.pack(fill=tk.BOTH, expand=True)
@@ -411,6 +433,10 @@ class NaoControlGUI:
         # Emergency stop keybinding
         self.root.bind("<KeyPress-Escape>", self.emergency_stop)
         
+        # Toggle live shape detection
+        self.root.bind("<KeyPress-b>", lambda e: self.toggle_detection())
+        self.root.bind("<KeyPress-B>", lambda e: self.toggle_detection())
+        
         # Prevent window closing via the 'X' button from causing errors
         self.root.protocol("WM_DELETE_WINDOW", self.quit_program)
     
@@ -430,21 +456,88 @@ class NaoControlGUI:
         # Schedule next update
         self.root.after(1000, self.update_system_time)
         
-        # Update simulated status values (for demonstration)
+        # Update robot telemetry values
         self.update_status_indicators()
+        
+        # Update camera pipeline statistics
+        self.update_camera_stats()
+    
+    def on_telemetry(self, changed):
+        """Telemetry subscriber, called on the reader thread"""
+        self.telemetry_changed = True
     
     def update_status_indicators(self):
-        # Simulate changing values for indicators
-        # In a real implementation, these would be updated from the robot
-        
-        # CPU load - simulated oscillation
-        cpu_load = 25 + 10 * math.sin(time.time() / 10.0)
-        self.cpu_status.set(f"{int(cpu_load)}%")
-        
-        # Battery - slowly decreasing
-        current_battery = int(self.battery_status.get().replace('%', ''))
-        new_battery = max(0, current_battery - (0.1 if time.time() % 10 < 0.1 else 0))
-        self.battery_status.set(f"{int(new_battery)}%")
+        """Show the latest robot telemetry if it changed since the last update"""
+        self.connection_status.set("ONLINE" if self.agent.is_connected() else "RECONNECTING")
+        if not self.telemetry_changed:
+            return
+        self.telemetry_changed = False
+        telemetry = self.agent.get_telemetry()
+        
+        if telemetry["battery_percent"] is not None:
+            self.battery_status.set(f"{telemetry['battery_percent']}%")
+        if telemetry["cpu_temperature"] is not None:
+            self.cpu_status.set(f"{telemetry['cpu_temperature']:.0f}°C")
+        if telemetry["hottest_joint"] is not None:
+            temperature, joint = telemetry["hottest_joint"]
+            self.joint_temp_status.set(f"{temperature:.0f}°C {joint}")
+        
+        # Motors: fallen overrides the stiffness state
+        if telemetry["fallen"]:
+            self.motor_status.set("FALLEN")
+        elif telemetry["mean_stiffness"] is not None:
+            self.motor_status.set("ACTIVE" if telemetry["mean_stiffness"] > 0.5 else "RELAXED")
+    
+    def on_detections(self, detections):
+        """Detection subscriber, called on the detection thread"""
+        self.pending_detections = detections
+    
+    def toggle_detection(self):
+        enabled = not self.agent.camera_controller.detection_enabled
+        if not self.agent.set_detection(enabled):
+            self.add_log_entry("Shape detection unavailable (needs OpenCV)")
+            return
+        if not enabled:
+            self.pending_detections = None
+            self.camera_canvas.delete("detection")
+        self.add_log_entry(f"Shape detection {'on' if enabled else 'off'}")
+    
+    def draw_detections(self):
+        """Replace the detection overlay with the newest detections, if any arrived"""
+        detections = self.pending_detections
+        if detections is None:
+            return
+        self.pending_detections = None
+        self.camera_canvas.delete("detection")
+        
+        # Detections are in stream pixels, the feed is drawn at display size from the top left
+        width, height = detections["size"]
+        scale_x = config.CAMERA_DISPLAY_WIDTH / float(width)
+        scale_y = config.CAMERA_DISPLAY_HEIGHT / float(height)
+        for obj in detections["objects"]:
+            colour = DETECTION_COLOURS.get(obj["color"], "#00f2c3")
+            x, y, w, h = obj["bbox"]
+            cx, cy = obj["position"]
+            self.camera_canvas.create_rectangle(
+                x * scale_x, y * scale_y, (x + w) * scale_x, (y + h) * scale_y,
+                outline=colour, width=2, tags="detection"
+            )
+            self.camera_canvas.create_oval(
+                cx * scale_x - 3, cy * scale_y - 3, cx * scale_x + 3, cy * scale_y + 3,
+                fill=colour, outline="", tags="detection"
+            )
+            self.camera_canvas.create_text(
+                x * scale_x, y * scale_y - 2, text=f"{obj['color']} {obj['shape']}",
+                fill=colour, font=('Helvetica', 9), anchor=tk.SW, tags="detection"
+            )
+    
+    def update_camera_stats(self):
+        """Show the median glass-to-glass latency reported by the camera pipeline"""
+        latency = self.agent.get_camera_metrics()["glass_to_glass"].get("p50_ms")
+        if latency is None:
+            self.latency_display.set("LAT: -- ms")
+        else:
+            self.latency_display.set(f"LAT: {latency:.0f} ms")
     
     def add_log_entry(self, message):
         # Add timestamp and message to log
@@ -549,6 +642,8 @@ class NaoControlGUI:
         
     def emergency_stop(self, event=None):
         """Emergency stop - halt all movement"""
+        # Interrupt any posture change or speech still running on the robot
+        self.agent.cancel()
         self.stop_movement()
         self.center_head()
         
@@ -806,12 +901,20 @@ class NaoControlGUI:
     def update_camera_display(self, image, fps):
         """Callback function for camera controller"""
         if image:
-            # Only update if we have a valid image to prevent flickering
-            # Store current image reference to avoid garbage collection
-            self.camera_img = image
+            # The controller pastes new frames into the same PhotoImage, so the
+            # canvas item only has to change when the image object does
+            if image is not self.camera_img:
+                # Store current image reference to avoid garbage collection
+                self.camera_img = image
+                if self.camera_item is None:
+                    self.camera_item = self.camera_canvas.create_image(0, 0, anchor='nw', image=self.camera_img)
+                    # Keep the overlay elements above the feed
+                    self.camera_canvas.tag_lower(self.camera_item)
+                else:
+                    self.camera_canvas.itemconfig(self.camera_item, image=self.camera_img)
             
-            # Update canvas without clearing it first to prevent flickering
-            self.camera_canvas.create_image(0, 0, anchor='nw', image=self.camera_img)
+            # Overlay the newest detections on the frame just painted
+            self.draw_detections()
             
             # Update FPS display
             self.fps_display.set(f"FPS: {fps}")
@@ -834,9 +937,9 @@ class NaoControlGUI:
         # Fixed to use only the top camera (ID=0)
         self.camera_id = 0
         
-        # Start camera with callback function
+        # Start camera with callback function, painted on the Tk thread
         self.agent.camera_controller.camera_id = 0  # Ensure using top camera
-        self.agent.start_camera(self.update_camera_display)
+        self.agent.start_camera(self.update_camera_display, self.root)
         
         # Start the movement update loop
         self.update_status()
@@ -0,0 +1,211 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Session Manager
+Connects to NAOqi with exponential backoff, watches the session with a
+heartbeat and reconnects when it is lost
+"""
+
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Delay before retry number attempt: exponential, capped, with up to half of it random"""
+    base = config.RECONNECT_BACKOFF if base is None else base
+    cap = config.RECONNECT_MAX_BACKOFF if cap is None else cap
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2.0 + random.uniform(0, delay / 2.0)
+
+
+class LazyService(object):
+    """Stands in for a service proxy that is still being resolved
+
+    Attribute access waits for the proxy on first use, so services nobody
+    calls never hold up startup. A new-style class, so that truth tests
+    and repr do not go through __getattr__.
+    """
+
+    def __init__(self, name, future):
+        self._name = name
+        self._future = future
+
+    def resolve(self, timeout=None):
+        """The real proxy; raises the error session.service raised, if any"""
+        return self._future.result(timeout)
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
+    def __repr__(self):
+        state = "resolved" if self._future.done() else "resolving"
+        return f"<LazyService {self._name} ({state})>"
+
+
+class SessionManager:
+    """Owns the qi session for a NaoEnvironment
+
+    Listeners added to on_connect are called with the new session after
+    every successful (re)connect, before it is reported as connected, so
+    they can re-create service proxies. on_disconnect listeners are called
+    when the heartbeat declares the session lost.
+    """
+
+    def __init__(self, url, session_factory):
+        self.url = url
+        self.session_factory = session_factory
+        self.session = None
+        self.probe = None  # Service pinged by the heartbeat
+        self.generation = 0  # Incremented on every successful connect
+        self.connected = threading.Event()
+        # Makes checking and clearing connected one step, so only one caller reports a loss
+        self.state_lock = threading.Lock()
+        self.on_connect = []
+        self.on_disconnect = []
+        self.running = False
+        self.stop_event = threading.Event()
+        self.wake = threading.Event()
+        self.signalled = False  # The session reported its own disconnect
+        self.thread = None
+        # Resolves service proxies concurrently
+        self.resolver = ThreadPoolExecutor(max_workers=8)
+
+    def resolve(self, session, name):
+        """Start resolving session.service(name) in the background and return a LazyService"""
+        return LazyService(name, self.resolver.submit(session.service, name))
+
+    def connect(self, max_attempts=None):
+        """Connect, retrying with backoff; max_attempts None keeps trying until stopped"""
+        attempt = 0
+        while max_attempts is None or attempt < max_attempts:
+            try:
+                session = self.session_factory()
+                print(f"Attempting to connect to: {self.url}")
+                session.connect(self.url)
+                self.probe = self.resolve(session, "ALMemory")
+                for listener in self.on_connect:
+                    listener(session)
+                self._watch(session)
+                self.session = session
+                self.generation += 1
+                self.connected.set()
+                print("Successfully connected to the robot!")
+                return True
+            except RuntimeError as e:
+                print(f"ERROR: Connection attempt #{attempt+1} failed: {e}")
+
+            attempt += 1
+            if max_attempts is not None and attempt >= max_attempts:
+                break
+            delay = backoff_delay(attempt - 1)
+            print(f"Retrying in {delay:.1f} seconds...")
+            if self.stop_event.wait(delay):
+                break
+        return False
+
+    def start_heartbeat(self):
+        if self.running:
+            return
+        self.running = True
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._heartbeat_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the heartbeat and any reconnect in progress, and close the session"""
+        self.running = False
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        self.thread = None
+        self.connected.clear()
+        self._close(self.session)
+        self.resolver.shutdown(wait=False)
+
+    def is_connected(self):
+        return self.connected.is_set()
+
+    def wait_connected(self, timeout=None):
+        """Block until the session is up; returns False on timeout"""
+        return self.connected.wait(timeout)
+
+    def is_alive(self):
+        """Probe the session with one ping, bounded by HEARTBEAT_TIMEOUT"""
+        session, probe = self.session, self.probe
+        if session is None or probe is None:
+            return False
+        try:
+            if not session.isConnected():
+                return False
+            # A proxy still resolving would otherwise block the heartbeat without a timeout
+            proxy = probe.resolve(config.HEARTBEAT_TIMEOUT)
+            future = proxy.ping(_async=True)
+            return bool(future.value(int(config.HEARTBEAT_TIMEOUT * 1000)))
+        except Exception:
+            return False
+
+    def report_failure(self):
+        """Called when a command failed in a way that suggests the link is down"""
+        if self.connected.is_set() and not self.is_alive():
+            self._lost()
+
+    def _watch(self, session):
+        ### qi sessions signal a disconnect; react to it without waiting for the heartbeat
+        signal = getattr(session, "disconnected", None)
+        if signal is not None:
+            try:
+                signal.connect(lambda *args: self._signal_lost(session))
+            except Exception:
+                pass
+
+    def _signal_lost(self, session):
+        if session is self.session:
+            self.signalled = True
+            self.wake.set()
+
+    def _lost(self):
+        ### The heartbeat and command threads may both get here; the first one runs the listeners
+        with self.state_lock:
+            if not self.connected.is_set():
+                return
+            self.connected.clear()
+        print("Connection to the robot lost, reconnecting...")
+        for listener in self.on_disconnect:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Error in disconnect handler: {e}")
+        self.wake.set()
+
+    def _close(self, session):
+        if session is None:
+            return
+        try:
+            session.close()
+        except Exception:
+            pass  # Already gone
+
+    def _heartbeat_loop(self):
+        misses = 0
+        while self.running:
+            self.wake.wait(config.HEARTBEAT_INTERVAL)
+            self.wake.clear()
+            if not self.running:
+                break
+
+            if self.connected.is_set():
+                if not self.signalled and self.is_alive():
+                    misses = 0
+                    continue
+                misses += 1
+                if not self.signalled and misses < config.HEARTBEAT_MISSES:
+                    continue
+                self._lost()
+
+            misses = 0
+            self.signalled = False
+            self._close(self.session)
+            self.connect()
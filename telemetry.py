@@ -0,0 +1,179 @@
+# -*- coding: future_fstrings -*-
+"""
+NAO Robot Control - Telemetry
+Battery, temperatures, stiffness and fall state read from ALMemory with one
+batched call per period
+"""
+
+import time
+import threading
+import collections
+import config
+from joint_state import BODY_JOINTS
+
+DEVICE_KEY = "Device/SubDeviceList/{}/{}"
+
+# Telemetry name -> ALMemory key for the robot-wide values
+ROBOT_KEYS = collections.OrderedDict([
+    ("battery", DEVICE_KEY.format("Battery", "Charge/Sensor/Value")),  # 0.0 - 1.0
+    ("cpu_temperature", DEVICE_KEY.format("Head", "Temperature/Sensor/Value")),  # Celsius
+    ("fallen", "robotHasFallen"),
+])
+
+
+def telemetry_keys(joints):
+    """Telemetry name -> ALMemory key, including per-joint temperature and stiffness"""
+    keys = collections.OrderedDict(ROBOT_KEYS)
+    for joint in joints:
+        keys[f"{joint}/temperature"] = DEVICE_KEY.format(joint, "Temperature/Sensor/Value")
+        keys[f"{joint}/stiffness"] = DEVICE_KEY.format(joint, "Hardness/Actuator/Value")
+    return keys
+
+
+class TimeSeries:
+    """Ring buffer of (local time, value) samples"""
+
+    def __init__(self, size):
+        self.samples = collections.deque(maxlen=size)
+
+    def add(self, timestamp, value):
+        self.samples.append((timestamp, value))
+
+    def values(self, since=None):
+        samples = list(self.samples)
+        if since is not None:
+            samples = [s for s in samples if s[0] >= since]
+        return samples
+
+
+class TelemetryReader:
+    """Polls ALMemory in the background and notifies subscribers of changed values
+
+    Subscribers are called on the reader thread with a dict of the values
+    that changed since the previous read; GUI code has to hand them over to
+    its own thread. Keys the robot does not publish are dropped after the
+    first failed read.
+    """
+
+    def __init__(self, nao_env, joints=None, rate=None, history=None):
+        self.nao = nao_env
+        self.joints = list(joints or BODY_JOINTS)
+        self.rate = rate or config.TELEMETRY_RATE
+        self.history_size = history or config.TELEMETRY_HISTORY
+        self.keys = telemetry_keys(self.joints)
+        self.lock = threading.Lock()
+        self.values = {}
+        self.series = dict((name, TimeSeries(self.history_size)) for name in self.keys)
+        self.subscribers = []
+        self.updated = None
+        self.running = False
+        self.thread = None
+
+    def subscribe(self, callback):
+        """Call callback(changed_values) after every read that changed something"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._poll_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def latest(self):
+        """Most recent value of everything read so far"""
+        with self.lock:
+            return dict(self.values)
+
+    def history(self, name, since=None):
+        """(time, value) samples of one telemetry value, oldest first"""
+        with self.lock:
+            return self.series[name].values(since)
+
+    def summary(self):
+        """Dashboard view: battery %, CPU and hottest joint temperatures, stiffness, fall state"""
+        values = self.latest()
+        temperatures = [(values[f"{j}/temperature"], j) for j in self.joints if f"{j}/temperature" in values]
+        stiffness = [values[f"{j}/stiffness"] for j in self.joints if f"{j}/stiffness" in values]
+        battery = values.get("battery")
+        return {
+            "battery_percent": int(round(battery * 100)) if battery is not None else None,
+            "cpu_temperature": values.get("cpu_temperature"),
+            "hottest_joint": max(temperatures) if temperatures else None,
+            "mean_stiffness": sum(stiffness) / len(stiffness) if stiffness else None,
+            "fallen": bool(values.get("fallen")) if "fallen" in values else None,
+        }
+
+    def read(self):
+        """Read every key with one getListData call and record the values"""
+        memory = self.nao.get_service("ALMemory")
+        names = list(self.keys)
+        values = memory.getListData([self.keys[name] for name in names])
+        now = time.time()
+
+        changed = {}
+        with self.lock:
+            for name, value in zip(names, values):
+                if value is None:
+                    continue
+                self.series[name].add(now, value)
+                if self.values.get(name) != value:
+                    changed[name] = value
+                self.values[name] = value
+            self.updated = now
+        return changed
+
+    def _drop_missing_keys(self):
+        ### Find the keys this robot does not publish, one getData each
+        memory = self.nao.get_service("ALMemory")
+        missing = []
+        for name, key in self.keys.items():
+            try:
+                memory.getData(key)
+            except Exception:
+                missing.append(name)
+        if len(missing) == len(self.keys):
+            raise RuntimeError("ALMemory is not answering")  # The link, not the keys
+        for name in missing:
+            print(f"Telemetry key '{self.keys[name]}' unavailable, skipping it")
+            del self.keys[name]
+
+    def _poll_loop(self):
+        interval = 1.0 / self.rate
+        checked = False
+        while self.running:
+            start = time.time()
+            if not self.nao.is_connected():
+                time.sleep(interval)
+                continue
+            try:
+                changed = self.read()
+            except Exception as e:
+                changed = None
+                if checked:
+                    print(f"Error reading telemetry: {e}")
+                else:
+                    try:
+                        self._drop_missing_keys()
+                        checked = True
+                    except Exception as e:
+                        print(f"Error reading telemetry: {e}")
+            if changed:
+                for callback in list(self.subscribers):
+                    # A failing subscriber is its own problem, not a sign of missing keys
+                    try:
+                        callback(changed)
+                    except Exception as e:
+                        print(f"Error in telemetry subscriber: {e}")
+            time.sleep(max(0.005, interval - (time.time() - start)))
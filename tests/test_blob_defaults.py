@@ -0,0 +1,36 @@
+# -*- coding: future_fstrings -*-
+# The detector defaults must keep their score against blob/annotations.json
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BLOB_DIR = os.path.join(ROOT, "blob")
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+@unittest.skipIf(cv2 is None, "needs OpenCV")
+class DetectorDefaultsTest(unittest.TestCase):
+    def setUp(self):
+        # benchmark.py imports detector as a sibling and annotations.json holds paths relative to blob/
+        self.cwd = os.getcwd()
+        os.chdir(BLOB_DIR)
+        sys.path.insert(0, BLOB_DIR)
+
+    def tearDown(self):
+        sys.path.remove(BLOB_DIR)
+        os.chdir(self.cwd)
+
+    def test_defaults_score_on_annotations(self):
+        import benchmark
+        benchmark._init_worker(benchmark.load_annotations(benchmark.ANNOTATIONS), {"scale": 0.5, "iou": 0.5})
+        result = benchmark.evaluate(benchmark.baseline_task())[0]
+        self.assertGreaterEqual(result["f1"], 0.89, result["errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
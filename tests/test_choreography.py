@@ -0,0 +1,38 @@
+# -*- coding: future_fstrings -*-
+# Routine files with mistakes must fail with the name of the move at fault
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from choreography import parse_routine, load_routine, DANCE_FILE
+
+
+class ParseRoutineTest(unittest.TestCase):
+    def assertRejected(self, move, message):
+        with self.assertRaises(ValueError) as caught:
+            parse_routine({"moves": [dict(move, name="Wave")]})
+        self.assertEqual(str(caught.exception), message)
+
+    def test_missing_angles(self):
+        self.assertRejected({"time": 1.0}, "Wave: missing 'angles'")
+
+    def test_missing_time(self):
+        self.assertRejected({"angles": {"HeadYaw": 0.5}}, "Wave: missing 'time'")
+
+    def test_time_not_a_number(self):
+        self.assertRejected({"angles": {"HeadYaw": 0.5}, "time": "soon"}, "Wave: time must be a number, not 'soon'")
+
+    def test_missing_moves(self):
+        with self.assertRaises(ValueError):
+            parse_routine({"name": "dance"})
+
+    def test_shipped_routine_parses(self):
+        self.assertTrue(load_routine(DANCE_FILE)["moves"])
+
+
+if __name__ == "__main__":
+    unittest.main()
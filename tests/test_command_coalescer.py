@@ -0,0 +1,80 @@
+# -*- coding: future_fstrings -*-
+# Coalesced walk and head commands against the fake NAOqi session
+import os
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from fake_naoqi import FakeSession, FakeRobot
+from robot_environment import NaoEnvironment
+from robot_agent import NaoActions
+
+
+class CommandCoalescerTest(unittest.TestCase):
+    LATENCY = 0.05  # Seconds per simulated call, long enough for commands to queue up behind one another
+
+    def setUp(self):
+        self.robot = FakeRobot()
+        self.nao = NaoEnvironment("127.0.0.1", 9559,
+                                  session_factory=lambda: FakeSession(self.LATENCY, 0.0, robot=self.robot))
+        self.assertTrue(self.nao.init_robot())
+        self.agent = NaoActions(self.nao)
+
+    def tearDown(self):
+        self.agent.close()
+
+    def wait_idle(self, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            channels = self.agent.coalescer.channels.values()
+            if not any(c.in_flight or c.pending or c.queued for c in channels) \
+                    and not any(self.nao.dispatcher.busy(name) for name in ("motion", "head")):
+                return
+            time.sleep(0.01)
+        self.fail("Commands still running")
+
+    def test_repeated_head_steps_add_up(self):
+        for _ in range(10):
+            self.agent.movehead(0.05, 0.0)
+        self.wait_idle()
+        head_yaw = self.robot.trajectories["HeadYaw"][-1][1]
+        self.assertAlmostEqual(head_yaw, 0.5, places=6)
+        self.assertLess(self.agent.get_command_stats()["sent"], 10)
+
+    def test_setpoint_near_the_last_one_sent_is_sent(self):
+        self.agent.walk(0.54, 0.0, 0.0).result(timeout=5.0)
+        self.agent.walk(0.549, 0.0, 0.0).result(timeout=5.0)
+        self.wait_idle()
+        self.assertEqual(self.robot.velocity, (0.549, 0.0, 0.0))
+
+    def test_setpoint_near_the_one_in_flight_is_sent(self):
+        self.agent.walk(0.54, 0.0, 0.0)
+        self.agent.walk(0.549, 0.0, 0.0)
+        self.wait_idle()
+        self.assertEqual(self.robot.velocity, (0.549, 0.0, 0.0))
+
+    def test_exact_repeat_is_skipped(self):
+        self.agent.walk(0.3, 0.0, 0.0).result(timeout=5.0)
+        self.agent.walk(0.3, 0.0, 0.0).result(timeout=5.0)
+        stats = self.agent.get_command_stats()
+        self.assertEqual(stats["sent"], 1)
+        self.assertEqual(stats["skipped"], 1)
+
+    def test_clear_drops_pending_setpoints(self):
+        self.agent.walk(0.3, 0.0, 0.0)  # In flight
+        pending = self.agent.walk(0.6, 0.0, 0.0)
+        queued_head = [self.agent.movehead(center=True), self.agent.movehead(0.1, 0.0)]
+        self.agent.coalescer.clear()
+        self.wait_idle()
+        self.assertTrue(pending.cancelled())
+        self.assertTrue(queued_head[1].cancelled())
+        self.assertEqual(self.robot.velocity, (0.3, 0.0, 0.0))
+        self.assertAlmostEqual(self.robot.trajectories["HeadYaw"][-1][1], 0.0, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
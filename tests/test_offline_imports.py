@@ -0,0 +1,49 @@
+# -*- coding: future_fstrings -*-
+# Modules used offline must import, and run on fake_naoqi, without the NAOqi SDK
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+OFFLINE_MODULES = ["robot_environment", "posture", "camera_benchmark"]
+
+
+class OfflineImportTest(unittest.TestCase):
+    def setUp(self):
+        # A None entry makes "import qi" raise ImportError, as on a machine without the SDK
+        self.saved = {name: sys.modules.pop(name) for name in ["qi"] + OFFLINE_MODULES if name in sys.modules}
+        sys.modules["qi"] = None
+
+    def tearDown(self):
+        for name in ["qi"] + OFFLINE_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(self.saved)
+
+    def test_modules_import_without_qi(self):
+        for name in OFFLINE_MODULES:
+            __import__(name)
+        import robot_environment, posture
+        self.assertIsNone(robot_environment.qi)
+        self.assertIsNone(posture.qi)
+
+    def test_environment_needs_a_session_factory_without_qi(self):
+        import robot_environment
+        with self.assertRaises(ImportError):
+            robot_environment.NaoEnvironment("127.0.0.1", 9559)
+
+    def test_environment_runs_on_fake_session_without_qi(self):
+        import robot_environment
+        from fake_naoqi import FakeSession
+        env = robot_environment.NaoEnvironment("127.0.0.1", 9559, session_factory=lambda: FakeSession(0, 0))
+        try:
+            self.assertTrue(env.init_robot())
+            self.assertTrue(env.is_connected())
+        finally:
+            env.close()
+
+
+if __name__ == "__main__":
+    unittest.main()